@@ -0,0 +1,37 @@
+"""
+Аутентификация по токену с кэшем.
+
+Токен вместе с пользователем хранится в кэше tokens, общем для всех
+воркеров: запись живет TIMEOUT секунд, записей не больше MAX_ENTRIES
+(см. CACHES в настройках). При удалении токена и изменении пользователя
+запись заменяется отметкой REVOKED: на время жизни записи токен
+проверяется по базе, а запрос, прочитавший базу до изменения, не может
+вернуть старую запись в кэш, потому что кэш заполняется через add.
+"""
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+REVOKED = 'revoked'
+
+
+def cache_key(key):
+    return f'token:{key}'
+
+
+def revoke(keys):
+    """Отзывает токены keys из кэша."""
+    caches['tokens'].set_many({cache_key(key): REVOKED for key in keys})
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к базе для токенов из кэша."""
+
+    def authenticate_credentials(self, key):
+        tokens = caches['tokens']
+        cached = tokens.get(cache_key(key))
+        if isinstance(cached, self.get_model()):
+            return cached.user, cached
+        user, token = super().authenticate_credentials(key)
+        if cached is None:
+            tokens.add(cache_key(key), token)
+        return user, token
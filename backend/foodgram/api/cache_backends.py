@@ -0,0 +1,48 @@
+"""
+Файловый кэш без вытеснения для версий и счетчиков.
+
+FileBasedCache при каждой записи перечисляет файлы каталога и, если их
+больше MAX_ENTRIES, удаляет случайную треть. Удаленная версия рецепта
+или справочника создается заново, и все ключи и ETag, построенные на
+ней, разом устаревают; удаленный счетчик начинается с нуля. Здесь
+записи удаляются только по сроку или явно: в этом кэше лежат версии,
+счетчики и состояние замеров, их число ограничено числом рецептов,
+авторов и процессов.
+
+add и incr выполняются под блокировкой файла, общей для всех процессов
+на сервере, поэтому одновременные прибавления не теряются, а из
+одновременных add успешен ровно один.
+"""
+import os
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+
+try:
+    import fcntl
+except ImportError:  # Windows: add и incr не синхронизируются
+    fcntl = None
+
+
+class DurableFileBasedCache(FileBasedCache):
+
+    def _cull(self):
+        pass
+
+    @contextmanager
+    def _lock(self):
+        self._createdir()
+        # Файл без суффикса кэша: clear() его не удаляет.
+        with open(os.path.join(self._dir, 'lock'), 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._lock():
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        with self._lock():
+            return super().incr(key, delta, version)
@@ -0,0 +1,95 @@
+"""
+Условные ответы и кэш ответов для справочников (теги, инградиенты).
+
+У каждого справочника есть версия - время последнего изменения в
+наносекундах, общая для всех воркеров через кэш state, из которого
+записи не вытесняются: иначе ETag менялись бы без изменений. Из версии
+получаются ETag и Last-Modified: клиент с актуальной версией получает
+304 без тела. Тело ответа в JSON кэшируется по версии и пути запроса,
+поэтому после изменения справочника старые тела просто не читаются.
+Кэшируются только ответы без параметров: поиск по названию и так идет
+по индексу в памяти, а тело на каждый префикс только вытесняло бы
+полные справочники из кэша.
+"""
+import time
+from functools import wraps
+
+from django.core.cache import cache, caches
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response,
+                                patch_cache_control, patch_vary_headers)
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+
+from api import replicas
+
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+# Тела ответов живут не дольше суток, даже если версия не менялась.
+BODY_TIMEOUT = 24 * 60 * 60
+
+
+def version(catalog):
+    """Версия справочника; создается при первом обращении."""
+    key = f'catalog:{catalog}:version'
+    current = caches['state'].get(key)
+    if current is None:
+        caches['state'].add(key, time.time_ns(), timeout=None)
+        current = caches['state'].get(key)
+    return current
+
+
+def bump(catalog):
+    """Новая версия справочника после его изменения."""
+    caches['state'].set(
+        f'catalog:{catalog}:version', time.time_ns(), timeout=None
+    )
+
+
+def conditional(catalog):
+    """
+    Декоратор list и retrieve справочника: 304 по If-None-Match и
+    If-Modified-Since, тело JSON из кэша.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            current = version(catalog)
+            etag = f'"{catalog}-{current}"'
+            # Last-Modified с точностью до секунды, как в HTTP.
+            last_modified = current // 10 ** 9 + 1
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                response = cached_response(
+                    self, request, catalog, current, method, args, kwargs
+                )
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                response['Last-Modified'] = http_date(last_modified)
+                patch_cache_control(response, no_cache=True)
+                patch_vary_headers(response, ['Accept'])
+            return response
+        return wrapper
+    return decorator
+
+
+def cached_response(view, request, catalog, current, method, args, kwargs):
+    """Ответ из кэша, если клиент ждет JSON; иначе обычный ответ view."""
+    if (
+        request.query_params
+        or not isinstance(request.accepted_renderer, JSONRenderer)
+    ):
+        return method(view, request, *args, **kwargs)
+    key = f'catalog:{catalog}:{current}:{request.path}'
+    body = cache.get(key)
+    if body is None:
+        # Тело живет до следующей версии: реплика могла ее еще не увидеть.
+        with replicas.primary():
+            response = method(view, request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        body = request.accepted_renderer.render(response.data)
+        cache.set(key, body, timeout=BODY_TIMEOUT)
+    return HttpResponse(body, content_type='application/json')
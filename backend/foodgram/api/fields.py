@@ -0,0 +1,115 @@
+"""
+Изображение рецепта строкой base64 в JSON.
+
+Строка декодируется кусками сразу во временный файл, поэтому в памяти,
+кроме самой строки, нет ни полной копии файла, ни копии без заголовка
+data:. Размер файла считается по длине строки до декодирования, а
+размеры картинки читаются из заголовка, как только он декодирован:
+слишком большое изображение отклоняется, не дойдя до конца строки.
+Проверку Pillow Django делает по пути временного файла, а хранилище
+переносит файл на место без чтения в память.
+"""
+import base64
+import binascii
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image
+from rest_framework import serializers
+
+from api import images
+
+# Длина куска строки base64, кратна 4.
+CHUNK_SIZE = 64 * 1024
+FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif'}
+
+
+class Base64ImageField(serializers.ImageField):
+    """Изображение строкой base64, с заголовком data: или без него."""
+    default_error_messages = {
+        'invalid_base64': 'Загрузите корректное изображение в base64.',
+        'invalid_format': 'Допустимые форматы: JPEG, PNG, GIF.',
+        'max_size': 'Размер изображения больше {max_size} байт.',
+        'max_pixels': 'Изображение больше {max_pixels} точек.',
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            self.fail('invalid_base64')
+        marker = data.find(';base64,')
+        start = 0 if marker == -1 else marker + len(';base64,')
+        # Оценка сверху: паддинг и пробелы не декодируются.
+        if (len(data) - start) * 3 // 4 > settings.RECIPE_IMAGE_MAX_SIZE + 2:
+            self.fail(
+                'max_size', max_size=settings.RECIPE_IMAGE_MAX_SIZE
+            )
+        file = TemporaryUploadedFile('image', None, 0, None)
+        try:
+            image_format = self.decode(data, start, file)
+            file.name = f'{uuid.uuid4().hex[:12]}.{FORMATS[image_format]}'
+            file.content_type = Image.MIME[image_format]
+            return super().to_internal_value(file)
+        except Exception:
+            file.close()
+            raise
+
+    def decode(self, data, start, file):
+        """Пишет данные строки с позиции start в file, возвращает формат."""
+        image_format = None
+        rest = ''
+        for position in range(start, len(data), CHUNK_SIZE):
+            chunk = rest + ''.join(
+                data[position:position + CHUNK_SIZE].split()
+            )
+            end = len(chunk) - len(chunk) % 4
+            self.write(file, chunk[:end])
+            rest = chunk[end:]
+            if image_format is None:
+                image_format = self.check_header(file)
+        if rest:
+            self.write(file, rest)
+        file.flush()
+        if image_format is None:
+            image_format = self.check_header(file)
+        if image_format is None:
+            self.fail('invalid_image')
+        return image_format
+
+    def write(self, file, chunk):
+        try:
+            decoded = base64.b64decode(chunk, validate=True)
+        except (binascii.Error, ValueError):
+            self.fail('invalid_base64')
+        file.size += len(decoded)
+        if file.size > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.fail(
+                'max_size', max_size=settings.RECIPE_IMAGE_MAX_SIZE
+            )
+        file.write(decoded)
+
+    def check_header(self, file):
+        """
+        Формат по уже записанной части файла или None, если заголовок
+        еще не дописан.
+        """
+        file.flush()
+        file.seek(0)
+        try:
+            image = Image.open(file)
+        except Image.DecompressionBombError:
+            self.fail(
+                'max_pixels', max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS
+            )
+        except images.ERRORS:
+            return None
+        finally:
+            file.seek(0, 2)
+        width, height = image.size
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            self.fail(
+                'max_pixels', max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS
+            )
+        if image.format not in FORMATS:
+            self.fail('invalid_format')
+        return image.format
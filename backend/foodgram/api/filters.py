@@ -1,70 +1,96 @@
-from django.db import models
-from django_filters import CharFilter, FilterSet
-from recipes.models import Favorite, Recipe, ShoppingCart, User
+from django import forms
+from django.db.models import Exists, OuterRef
+from django_filters import (CharFilter, FilterSet, MultipleChoiceFilter,
+                            NumberFilter)
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
+
+from api import search
+
+
+class SlugsField(forms.MultipleChoiceField):
+    """Список слагов без проверки: по неизвестному слагу ничего нет."""
+
+    def valid_value(self, value):
+        return True
+
+
+class TagSlugsFilter(MultipleChoiceFilter):
+    field_class = SlugsField
 
 
 class RecipeFilter(FilterSet):
-    """Фильт рецептов по url параметрам."""
-    is_favorited = CharFilter(method='get_favorited')
-    is_in_shopping_cart = CharFilter(method='get_shop_cart')
-    author = CharFilter(method='get_author')
+    """
+    Фильт рецептов по url параметрам.
+    Без тегов лента пуста: так фронтенд передает, что сняты все теги.
+    Корзина от тегов не зависит.
+    Каждое условие - EXISTS по индексу связи или сравнение с колонкой
+    рецепта, поэтому любое сочетание фильтров - один запрос без JOIN
+    и DISTINCT.
+    """
+    tags = TagSlugsFilter(method='filter_tags')
+    is_favorited = CharFilter(method='filter_favorited')
+    is_in_shopping_cart = CharFilter(method='filter_shopping_cart')
+    author = NumberFilter(field_name='author_id')
+    search = CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
         # имена query params в url
         fields = [
+            'tags',
             'is_favorited',
             'is_in_shopping_cart',
             'author',
+            'search',
         ]
 
-    def get_favorited(self, queryset, name, value):
-        username = self.request.user
-        if username.is_authenticated:
-            user = User.objects.get(username=username)
-        else:
-            user = None
-        if user and value == '1':
-            return queryset.filter(
-                id__in=Favorite.objects
-                .filter(user=user).values('recipe__id'))
-        return queryset.none()
-
-    def get_author(self, queryset, name, value):
-        return queryset.filter(
-            author=User.objects.get(id=value),
-        )
+    def filter_queryset(self, queryset):
+        if not self.in_shopping_cart() and not self.form.cleaned_data.get(
+            'tags'
+        ):
+            return queryset.none()
+        return super().filter_queryset(queryset)
+
+    def in_shopping_cart(self):
+        return self.form.cleaned_data.get('is_in_shopping_cart') == '1'
 
-    def get_shop_cart(self, queryset, name, value):
-        username = self.request.user
-        if username.is_authenticated:
-            user = User.objects.get(username=username)
-        else:
-            user = None
-        if user and value == '1':
-            return (
-                queryset
-                .filter(id__in=ShoppingCart.objects
-                        .filter(user=user).values('recipe__id'))
+    def filter_tags(self, queryset, name, value):
+        if self.in_shopping_cart():
+            return queryset
+        return filter_exists(
+            queryset, 'has_tags', Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'),
+                tag_id__in=Tag.objects.filter(slug__in=value).values('id'),
             )
-        return queryset.none()
+        )
 
-    def filter_tags(self, queryset):
-        """Используется в filter_queryset """
-        tags = self.request.query_params.getlist('tags')
-        return queryset.filter(
-            tags__slug__in=tags
-        ).distinct()
+    def filter_search(self, queryset, name, value):
+        return search.search(queryset, value)
 
-    def filter_queryset(self, queryset):
-        shop_cart = self.form.cleaned_data.get('is_in_shopping_cart')
-        for name, value in self.form.cleaned_data.items():
-            queryset = self.filters[name].filter(queryset, value)
-            assert isinstance(queryset, models.QuerySet), (
-                "Expected '%s.%s' to return a QuerySet, but got a %s instead."
-                % (type(self).__name__, name, type(queryset).__name__)
-            )
+    def filter_favorited(self, queryset, name, value):
+        return self.filter_user_flag(queryset, name, value, Favorite)
 
-        if shop_cart == '1':
-            return queryset
-        return self.filter_tags(queryset)
+    def filter_shopping_cart(self, queryset, name, value):
+        return self.filter_user_flag(queryset, name, value, ShoppingCart)
+
+    def filter_user_flag(self, queryset, name, value, model):
+        """
+        name=1 - рецепты с отметкой пользователя в model. Аннотация с
+        тем же именем из RecipeViewSet.get_queryset используется повторно.
+        """
+        user = self.request.user
+        if not user.is_authenticated or value != '1':
+            return queryset.none()
+        return filter_exists(queryset, name, model.objects.filter(
+            user=user, recipe=OuterRef('pk')
+        ))
+
+
+def filter_exists(queryset, name, subquery):
+    """
+    Рецепты, для которых subquery не пуст. Django 2.2 фильтрует по
+    EXISTS только через аннотацию.
+    """
+    if name not in queryset.query.annotations:
+        queryset = queryset.annotate(**{name: Exists(subquery)})
+    return queryset.filter(**{name: True})
@@ -0,0 +1,137 @@
+"""
+Уменьшенные копии изображений рецептов.
+
+Запрос на создание или изменение рецепта только сохраняет оригинал и
+ставит его в очередь RecipeImageTask. Команда processimages разбирает
+очередь вне запросов: для каждого размера из SIZES пишет JPEG и WebP и
+отмечает рецепт в processed_image. Пути копий выводятся из имени
+оригинала, поэтому сериализаторам хватает полей рецепта: пока копии не
+готовы, вместо них отдается заглушка, а в image - оригинал.
+"""
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+from recipes.models import Recipe, RecipeImageTask
+
+# Наибольшая ширина копии; высота пропорциональна.
+SIZES = {'small': 320, 'medium': 640, 'large': 1280}
+FORMATS = {'jpeg': 'JPEG', 'webp': 'WEBP'}
+QUALITY = 82
+ERRORS = (OSError, ValueError, Image.DecompressionBombError)
+# Копия для поля image карточки рецепта и короткой карточки.
+CARD_SIZE = 'medium'
+PREVIEW_SIZE = 'small'
+PLACEHOLDER = 'api/recipe-placeholder.svg'
+VARIANTS = 'recipes/variants'
+
+
+def enqueue(recipe):
+    """Ставит изображение рецепта в очередь на копии."""
+    RecipeImageTask.objects.create(recipe=recipe, image=recipe.image.name)
+
+
+def is_ready(recipe):
+    return bool(recipe.image) and recipe.processed_image == recipe.image.name
+
+
+def variant_name(image, size, extension):
+    stem = os.path.splitext(os.path.basename(image))[0]
+    return f'{VARIANTS}/{stem}-{size}.{extension}'
+
+
+def variant_url(recipe, size, extension):
+    name = variant_name(recipe.image.name, size, extension)
+    return f'{settings.MEDIA_URL}{name}'
+
+
+def url(recipe, size):
+    """Копия JPEG размера size, пока ее нет - оригинал."""
+    if is_ready(recipe):
+        return variant_url(recipe, size, 'jpeg')
+    return f'{settings.MEDIA_URL}{recipe.image}'
+
+
+def urls(recipe):
+    """Адреса всех копий по размерам и форматам, пока их нет - заглушка."""
+    if not is_ready(recipe):
+        placeholder = f'{settings.STATIC_URL}{PLACEHOLDER}'
+        return {
+            size: dict.fromkeys(FORMATS, placeholder) for size in SIZES
+        }
+    return {
+        size: {
+            extension: variant_url(recipe, size, extension)
+            for extension in FORMATS
+        }
+        for size in SIZES
+    }
+
+
+def make_variants(image):
+    """
+    Пишет копии оригинала image во всех размерах и форматах. Имя
+    оригинала задает его содержимое, поэтому готовые копии той же
+    картинки из другого рецепта не пересчитываются.
+    """
+    names = [
+        variant_name(image, size, extension)
+        for size in SIZES for extension in FORMATS
+    ]
+    if all(default_storage.exists(name) for name in names):
+        return
+    with Recipe.image.field.storage.open(image) as file:
+        original = ImageOps.exif_transpose(Image.open(file))
+        original.load()
+    has_alpha = 'A' in original.getbands() or 'transparency' in original.info
+    original = original.convert('RGBA' if has_alpha else 'RGB')
+    for size, width in SIZES.items():
+        variant = original.copy()
+        # Копия не бывает больше оригинала.
+        variant.thumbnail((width, variant.height))
+        for extension, image_format in FORMATS.items():
+            output = variant
+            if image_format == 'JPEG' and has_alpha:
+                output = Image.new('RGB', variant.size, 'white')
+                output.paste(variant, mask=variant.getchannel('A'))
+            buffer = BytesIO()
+            output.save(buffer, image_format, quality=QUALITY)
+            name = variant_name(image, size, extension)
+            # Повторная обработка перезаписывает копии на тех же путях.
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def process_pending(batch_size):
+    """
+    Обрабатывает до batch_size задач очереди. Возвращает id готовых
+    рецептов и ошибки по задачам. Задачи, взятые другими процессами,
+    пропускаются.
+    """
+    done, errors = [], []
+    with transaction.atomic():
+        tasks = list(
+            RecipeImageTask.objects
+            .select_for_update(skip_locked=True)
+            .order_by('id')[:batch_size]
+        )
+        for task in tasks:
+            try:
+                make_variants(task.image)
+            except ERRORS as error:
+                errors.append((task, error))
+                continue
+            # Изображение могли заменить, пока шла обработка.
+            if Recipe.objects.filter(
+                id=task.recipe_id, image=task.image
+            ).update(processed_image=task.image):
+                done.append(task.recipe_id)
+        RecipeImageTask.objects.filter(
+            id__in=[task.id for task in tasks]
+        ).delete()
+    return done, errors
@@ -0,0 +1,353 @@
+"""
+Индекс инградиентов для поиска по названию.
+
+Каталог хранится в файле, отсортированном по названию в нижнем регистре,
+и отображается в память каждым воркером только для чтения: страницы
+файла общие для всех процессов, поиск не обращается к базе данных.
+Файл перестраивается после изменения инградиентов; воркеры замечают
+новый файл по его inode и открывают его заново.
+
+Кроме записей в файле лежит триграммный индекс для нечеткого поиска:
+для каждой триграммы (как в pg_trgm, слова дополняются пробелами)
+хранится отсортированный список позиций записей.
+
+Формат файла: заголовок, смещения записей, число триграмм каждой
+записи, таблица триграмм, записи, списки позиций.
+"""
+import bisect
+import math
+import mmap
+import os
+import re
+import struct
+import tempfile
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from itertools import chain
+
+from django.conf import settings
+from django.db import transaction
+from recipes.models import Ingredient
+
+from api import catalog, replicas
+
+try:
+    import fcntl
+except ImportError:  # Windows: сборки индекса не синхронизируются
+    fcntl = None
+
+MAGIC = b'FGI2'
+# magic, число записей, число триграмм
+HEADER = struct.Struct('<4sII')
+UINT = struct.Struct('<I')
+# триграмма в utf-8, смещение и длина списка позиций
+TRIGRAM = struct.Struct('<12sII')
+WORD = re.compile(r'\w+')
+
+# Наибольшее число результатов ранжированного поиска.
+RANKED_LIMIT = 20
+# Пороги сходства по триграммам для нечетких совпадений, последний -
+# наименьшее допустимое сходство.
+THRESHOLDS = (0.8, 0.6, 0.45, 0.3)
+
+_index = None
+
+
+def trigrams(text):
+    """Триграммы слов текста; слово дополняется пробелами, как в pg_trgm."""
+    result = set()
+    for word in WORD.findall(text.casefold()):
+        word = f'  {word} '
+        result.update(word[i:i + 3] for i in range(len(word) - 2))
+    return result
+
+
+def contains(positions, position):
+    """Есть ли позиция в отсортированном списке."""
+    found = bisect.bisect_left(positions, position)
+    return found < len(positions) and positions[found] == position
+
+
+class Keys:
+    """Последовательность ключей записей или триграмм для bisect."""
+
+    def __init__(self, count, key):
+        self.count = count
+        self.key = key
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, position):
+        return self.key(position)
+
+
+class IngredientIndex:
+    """Отображенный в память файл индекса."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as index_file:
+            self.stat = os.fstat(index_file.fileno())
+            self.buffer = mmap.mmap(
+                index_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        magic, self.count, self.trigram_count = HEADER.unpack_from(
+            self.buffer
+        )
+        if magic != MAGIC:
+            raise ValueError(f'{path} не является индексом инградиентов')
+        view = memoryview(self.buffer)
+        position = HEADER.size
+        self.offsets = view[
+            position:position + UINT.size * self.count
+        ].cast('I')
+        position += UINT.size * self.count
+        self.sizes = view[
+            position:position + UINT.size * self.count
+        ].cast('I')
+        self.trigram_start = position + UINT.size * self.count
+
+    def is_current(self, stat):
+        return (
+            (self.stat.st_ino, self.stat.st_mtime_ns)
+            == (stat.st_ino, stat.st_mtime_ns)
+        )
+
+    def key(self, position):
+        start = self.offsets[position]
+        return self.buffer[start:self.buffer.find(b'\0', start)]
+
+    def record(self, position):
+        start = self.offsets[position]
+        line = self.buffer[start:self.buffer.find(b'\n', start)]
+        _, pk, name, measurement_unit = line.decode().split('\0')
+        return {
+            'id': int(pk),
+            'name': name,
+            'measurement_unit': measurement_unit,
+        }
+
+    def trigram_key(self, number):
+        return TRIGRAM.unpack_from(
+            self.buffer, self.trigram_start + TRIGRAM.size * number
+        )[0]
+
+    def postings(self, trigram):
+        """Отсортированные позиции записей, содержащих триграмму."""
+        key = trigram.encode().ljust(12, b'\0')
+        number = bisect.bisect_left(
+            Keys(self.trigram_count, self.trigram_key), key
+        )
+        if number == self.trigram_count:
+            return ()
+        found, start, length = TRIGRAM.unpack_from(
+            self.buffer, self.trigram_start + TRIGRAM.size * number
+        )
+        if found != key:
+            return ()
+        return memoryview(self.buffer)[
+            start:start + UINT.size * length
+        ].cast('I')
+
+    def prefix_positions(self, prefix):
+        prefix = prefix.casefold().encode()
+        position = bisect.bisect_left(Keys(self.count, self.key), prefix)
+        while (
+            position < self.count
+            and self.key(position).startswith(prefix)
+        ):
+            yield position
+            position += 1
+
+    def substring_positions(self, query):
+        """Записи, содержащие query; нужны триграммы внутри слов запроса."""
+        inner = {
+            word[i:i + 3]
+            for word in WORD.findall(query)
+            for i in range(len(word) - 2)
+        }
+        if not inner:
+            return
+        lists = sorted(map(self.postings, inner), key=len)
+        needle = query.encode()
+        for position in lists[0]:
+            if (
+                all(contains(other, position) for other in lists[1:])
+                and needle in self.key(position)
+            ):
+                yield position
+
+    def fuzzy_positions(self, query, limit):
+        """
+        До limit записей со сходством по триграммам не ниже THRESHOLDS[-1],
+        от более похожих к менее похожим.
+        """
+        query_trigrams = trigrams(query)
+        if not query_trigrams:
+            return []
+        lists = sorted(map(self.postings, query_trigrams), key=len)
+        # Сначала ищутся только очень похожие записи: для них хватает
+        # самых редких триграмм. Порог снижается, пока записей мало.
+        for threshold in THRESHOLDS:
+            ranked = self.similar(query_trigrams, lists, threshold)
+            if len(ranked) >= limit:
+                break
+        return [position for _, position in sorted(ranked)[:limit]]
+
+    def similar(self, query_trigrams, lists, threshold):
+        """Пары (-сходство, позиция) для записей со сходством threshold."""
+        # Запись со сходством threshold содержит не меньше required
+        # триграмм запроса, значит хотя бы одну из самых редких scanned
+        # триграмм: кандидаты берутся только из их списков.
+        required = max(1, math.ceil(threshold * len(query_trigrams)))
+        scanned = len(lists) - required + 1
+        overlaps = Counter(chain.from_iterable(lists[:scanned]))
+        ranked = []
+        for position, overlap in overlaps.items():
+            size = self.sizes[position]
+            # Даже при всех совпадениях в непросмотренных списках запись
+            # не наберет нужного сходства.
+            best = overlap + len(lists) - scanned
+            if best < threshold * (len(query_trigrams) + size - best):
+                continue
+            overlap += sum(
+                contains(other, position) for other in lists[scanned:]
+            )
+            similarity = overlap / (len(query_trigrams) + size - overlap)
+            if similarity >= threshold:
+                ranked.append((-similarity, position))
+        return ranked
+
+    def search(self, prefix):
+        """Инградиенты, название которых начинается с prefix."""
+        return [
+            self.record(position)
+            for position in self.prefix_positions(prefix)
+        ]
+
+    def ranked_search(self, query, limit=RANKED_LIMIT):
+        """
+        Поиск с опечатками: сначала совпадения по началу названия,
+        затем по подстроке, затем похожие по триграммам.
+        """
+        query = ' '.join(WORD.findall(query.casefold()))
+        found = []
+        seen = set()
+        for positions in (
+            self.prefix_positions(query),
+            self.substring_positions(query),
+            self.fuzzy_positions(query, limit),
+        ):
+            for position in positions:
+                if len(found) == limit:
+                    break
+                if position not in seen:
+                    seen.add(position)
+                    found.append(position)
+            if len(found) == limit:
+                break
+        return [self.record(position) for position in found]
+
+
+def write(path, rows):
+    """Записывает индекс строк (id, название, ед. изм.) в файл path."""
+    rows = sorted(
+        (name.casefold(), pk, name, measurement_unit)
+        for pk, name, measurement_unit in rows
+    )
+    records = []
+    sizes = []
+    postings = defaultdict(list)
+    for position, (key, pk, name, measurement_unit) in enumerate(rows):
+        records.append(
+            '\0'.join([key, str(pk), name, measurement_unit])
+            .replace('\n', ' ').encode() + b'\n'
+        )
+        record_trigrams = trigrams(key)
+        sizes.append(len(record_trigrams))
+        for trigram in record_trigrams:
+            postings[trigram].append(position)
+    table = sorted(
+        (trigram.encode().ljust(12, b'\0'), positions)
+        for trigram, positions in postings.items()
+    )
+
+    start = (
+        HEADER.size + 2 * UINT.size * len(records)
+        + TRIGRAM.size * len(table)
+    )
+    offsets = []
+    for record in records:
+        offsets.append(start)
+        start += len(record)
+    start += -start % UINT.size
+    trigram_table = []
+    for key, positions in table:
+        trigram_table.append(TRIGRAM.pack(key, start, len(positions)))
+        start += UINT.size * len(positions)
+
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(path), delete=False
+    ) as index_file:
+        index_file.write(HEADER.pack(MAGIC, len(records), len(table)))
+        index_file.write(struct.pack(f'<{len(offsets)}I', *offsets))
+        index_file.write(struct.pack(f'<{len(sizes)}I', *sizes))
+        index_file.writelines(trigram_table)
+        index_file.writelines(records)
+        index_file.write(b'\0' * (-index_file.tell() % UINT.size))
+        for _, positions in table:
+            index_file.write(struct.pack(f'<{len(positions)}I', *positions))
+    os.replace(index_file.name, path)
+
+
+@contextmanager
+def _build_lock(path):
+    """Сборки из разных процессов выполняются по очереди."""
+    with open(f'{path}.lock', 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def rebuild():
+    """Собирает индекс из базы и атомарно подменяет файл."""
+    path = settings.INGREDIENT_INDEX_PATH
+    with _build_lock(path), replicas.primary():
+        # Данные читаются под блокировкой и с основной базы: более
+        # поздняя сборка всегда видит более поздние изменения.
+        write(path, Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit'
+        ).iterator())
+    catalog.bump(catalog.INGREDIENTS)
+
+
+def get_index():
+    """Текущий индекс процесса; открывается заново после пересборки."""
+    global _index
+    path = settings.INGREDIENT_INDEX_PATH
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        rebuild()
+        stat = os.stat(path)
+    if _index is None or not _index.is_current(stat):
+        try:
+            _index = IngredientIndex(path)
+        except ValueError:
+            # Файл старого формата.
+            rebuild()
+            _index = IngredientIndex(path)
+    return _index
+
+
+def search(prefix):
+    return get_index().search(prefix)
+
+
+def ranked_search(query):
+    return get_index().ranked_search(query)
+
+
+def invalidate():
+    """Пересборка после фиксации транзакции, изменившей инградиенты."""
+    transaction.on_commit(rebuild)
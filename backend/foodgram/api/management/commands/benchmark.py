@@ -0,0 +1,424 @@
+import base64
+import os
+import random
+import statistics
+import struct
+import tempfile
+import time
+import tracemalloc
+import zlib
+from io import BytesIO
+from itertools import product
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F, Prefetch, Sum
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from drf_extra_fields.fields import Base64ImageField as LibraryImageField
+from PIL import Image
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredients,
+                            ShoppingCart, Tag, User)
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api import ingredient_index
+from api.authentication import CachedTokenAuthentication
+from api.fields import Base64ImageField
+from api.serializers import IngredientGetSerializer
+
+
+class Command(BaseCommand):
+    ''' Замеры времени отдельных участков API '''
+    help = 'Сравнивает время выполнения вариантов одного участка API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'target',
+            help=(
+                'Участок: ingredients, ingredient_search, '
+                'recipe_ingredients, auth, filters, search, upload.'
+            )
+        )
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument(
+            '--scale', type=int, default=100,
+            help='Во сколько раз увеличить каталог для ingredient_search.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--explain', action='store_true',
+            help='Вывести планы запросов для filters и search.'
+        )
+
+    def handle(self, *args, **options):
+        bench = getattr(self, f'bench_{options["target"]}', None)
+        if bench is None:
+            raise CommandError(f'Неизвестный участок {options["target"]}.')
+        self.rnd = random.Random(options['seed'])
+        self.options = options
+        bench(options['repeat'])
+
+    def report(self, label, func, arguments):
+        """Медиана и 95-й перцентиль времени вызова func."""
+        timings = []
+        for argument in arguments:
+            started = time.perf_counter()
+            func(argument)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write('{:<40} median {:8.3f} ms   p95 {:8.3f} ms'.format(
+            label,
+            statistics.median(timings),
+            timings[int(len(timings) * 0.95)],
+        ))
+
+    def bench_ingredients(self, repeat):
+        """Поиск инградиента по началу названия: ORM и общий индекс."""
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            raise CommandError('Каталог инградиентов пуст.')
+        prefixes = [
+            name[:self.rnd.randint(1, 3)]
+            for name in self.rnd.choices(names, k=repeat)
+        ]
+        ingredient_index.search('')
+        self.report(
+            'ORM name__istartswith + сериализатор',
+            lambda prefix: IngredientGetSerializer(
+                Ingredient.objects.filter(name__istartswith=prefix),
+                many=True,
+            ).data,
+            prefixes,
+        )
+        self.report('Индекс в памяти', ingredient_index.search, prefixes)
+
+    def typo(self, name):
+        """Название с опечаткой и переставленными словами."""
+        words = name.split()
+        self.rnd.shuffle(words)
+        name = ' '.join(words)
+        position = self.rnd.randrange(len(name))
+        return name[:position] + self.rnd.choice('аеиоу') + name[
+            position + 1:
+        ]
+
+    def bench_ingredient_search(self, repeat):
+        """Ранжированный поиск на каталоге и на увеличенном каталоге."""
+        rows = list(
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit')
+        )
+        if not rows:
+            raise CommandError('Каталог инградиентов пуст.')
+        names = [name for _, name, _ in rows]
+        queries = [
+            self.typo(name) for name in self.rnd.choices(names, k=repeat)
+        ] + [
+            name[:self.rnd.randint(3, 8)]
+            for name in self.rnd.choices(names, k=repeat)
+        ]
+        adjectives = [
+            'свежий', 'сушеный', 'молотый', 'замороженный', 'копченый',
+            'соленый', 'маринованный', 'органический', 'тертый', 'жареный',
+            'вареный', 'домашний',
+        ]
+        suffixes = [''] + [
+            f' {first} {second}'
+            for first, second in product(adjectives, repeat=2)
+        ]
+        scale = self.options['scale']
+        scaled = [
+            (pk * scale + number, name + suffix, unit)
+            for pk, name, unit in rows
+            for number, suffix in enumerate(suffixes[:scale])
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            for label, catalog in (
+                (f'{len(rows)} строк', rows),
+                (f'{len(scaled)} строк', scaled),
+            ):
+                path = os.path.join(directory, 'ingredients.idx')
+                started = time.perf_counter()
+                ingredient_index.write(path, catalog)
+                self.stdout.write(
+                    f'Сборка индекса {label}: '
+                    f'{time.perf_counter() - started:.1f} с'
+                )
+                index = ingredient_index.IngredientIndex(path)
+                self.report(
+                    f'mode=fuzzy, {label}', index.ranked_search, queries
+                )
+
+    def bench_recipe_ingredients(self, repeat):
+        """Суммы по корзине пользователя и инградиенты одного рецепта."""
+        users = list(
+            ShoppingCart.objects.values_list('user_id', flat=True).distinct()
+        )
+        recipes = list(Recipe.objects.values_list('id', flat=True))
+        if not users or not recipes:
+            raise CommandError('Нет рецептов в корзинах.')
+        self.report(
+            'Суммы инградиентов по корзине',
+            lambda user: list(
+                ShoppingCart.objects
+                .filter(
+                    user_id=user, recipe__recipe_ingredients__isnull=False
+                )
+                .values(ingredient_id=F(
+                    'recipe__recipe_ingredients__ingredient_id'
+                ))
+                .annotate(amount=Sum('recipe__recipe_ingredients__amount'))
+                .order_by()
+            ),
+            self.rnd.choices(users, k=repeat),
+        )
+        self.report(
+            'Инградиенты рецепта',
+            lambda recipe: Recipe.objects.prefetch_related(Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredients.objects.select_related(
+                    'ingredient'
+                ),
+            )).get(id=recipe),
+            self.rnd.choices(recipes, k=repeat),
+        )
+
+    def bench_auth(self, repeat):
+        """
+        Проверка токена: запрос к базе и кэш токенов. Удаленный токен
+        должен перестать проходить сразу.
+        """
+        users = list(User.objects.filter(is_active=True)[:100])
+        if not users:
+            raise CommandError('Нет пользователей.')
+        keys = [
+            Token.objects.get_or_create(user=user)[0].key for user in users
+        ]
+        cached = CachedTokenAuthentication()
+        for key in keys:
+            cached.authenticate_credentials(key)
+        arguments = self.rnd.choices(keys, k=repeat)
+        self.report(
+            'TokenAuthentication',
+            TokenAuthentication().authenticate_credentials, arguments,
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.report(
+                'CachedTokenAuthentication',
+                cached.authenticate_credentials, arguments,
+            )
+        self.stdout.write(f'Запросов из кэша: {len(queries)}')
+        token = Token.objects.get(key=keys[0])
+        token.delete()
+        try:
+            cached.authenticate_credentials(token.key)
+        except AuthenticationFailed:
+            self.stdout.write(self.style.SUCCESS('Удаленный токен отклонен.'))
+        else:
+            raise CommandError('Удаленный токен прошел проверку.')
+        finally:
+            # Пользователь не теряет токен из-за замера.
+            Token.objects.create(key=token.key, user=token.user)
+
+    def bench_filters(self, repeat):
+        """
+        Лента рецептов со всеми сочетаниями фильтров: каждое сочетание -
+        запрос числа строк и запрос страницы, оба без DISTINCT.
+        """
+        user = User.objects.filter(
+            id__in=Favorite.objects.values('user'),
+        ).filter(
+            id__in=ShoppingCart.objects.values('user'),
+        ).first()
+        if user is None:
+            raise CommandError('Нет пользователей с избранным и корзиной.')
+        recipe = Recipe.objects.filter(favorite__user=user).first()
+        filters = {
+            'tags': list(
+                recipe.tags.values_list('slug', flat=True)
+            ) or list(Tag.objects.values_list('slug', flat=True)[:2]),
+            'author': recipe.author_id,
+            'is_favorited': 1,
+            'is_in_shopping_cart': 1,
+        }
+        path = reverse('recipe-list')
+        match = resolve(path)
+        failures = 0
+        for enabled in product((False, True), repeat=len(filters)):
+            params = {
+                name: value
+                for (name, value), on in zip(filters.items(), enabled) if on
+            }
+
+            def call(_):
+                request = APIRequestFactory().get(path, params)
+                force_authenticate(request, user=user)
+                return match.func(request)
+
+            # Карточки рецептов берутся из кэша и в замер не попадают.
+            call(None)
+            with CaptureQueriesContext(connection) as context:
+                response = call(None)
+            label = ', '.join(params) or 'без фильтров'
+            statements = [query['sql'] for query in context.captured_queries]
+            if (
+                response.status_code != 200
+                or len(statements) > 2
+                or any('DISTINCT' in sql for sql in statements)
+            ):
+                failures += 1
+                self.stdout.write(self.style.ERROR(
+                    f'{label}: статус {response.status_code}, '
+                    f'запросов {len(statements)}'
+                ))
+            self.report(
+                f'{label} ({response.data["count"]})', call, range(repeat)
+            )
+            if self.options['explain']:
+                self.explain(statements)
+        if failures:
+            raise CommandError(f'Нарушений: {failures}.')
+        self.stdout.write(self.style.SUCCESS('Все сочетания без DISTINCT.'))
+
+    def bench_search(self, repeat):
+        """
+        Поиск по ленте: слова из названий и описаний рецептов, одно и
+        два слова в запросе. Считается число найденных и страница.
+        """
+        recipes = list(
+            Recipe.objects.values_list('name', 'text').order_by('?')[:50]
+        )
+        if not recipes:
+            raise CommandError('Нет рецептов.')
+        words = [
+            word for name, text in recipes
+            for word in (name.split() + text.split()[:5])
+            if len(word) > 3
+        ]
+        path = reverse('recipe-list')
+        match = resolve(path)
+
+        def call(text):
+            request = APIRequestFactory().get(path, {'search': text})
+            return match.func(request)
+
+        for count in (1, 2):
+            queries = [
+                ' '.join(self.rnd.sample(words, count)) for _ in range(repeat)
+            ]
+            for text in queries:
+                call(text)
+            self.report(f'Слов в запросе: {count}', call, queries)
+        if self.options['explain']:
+            with CaptureQueriesContext(connection) as context:
+                call(queries[0])
+            self.stdout.write(queries[0])
+            self.explain([query['sql'] for query in context.captured_queries])
+
+    def bench_upload(self, repeat):
+        """
+        Изображение рецепта в base64: пик памяти Python и время разбора
+        полем drf-extra-fields и потоковым полем, отказ по размеру файла
+        и по размерам картинки, а также запрос на создание рецепта.
+        """
+        width, height = 1800, 1500
+        noise = Image.frombytes(
+            'RGB', (width, height), self.rnd.randbytes(width * height * 3)
+        )
+        buffer = BytesIO()
+        noise.save(buffer, 'PNG')
+        photo = buffer.getvalue()
+        self.stdout.write(f'Изображение {len(photo)} байт')
+        cases = [
+            ('drf-extra-fields', LibraryImageField, photo),
+            ('Потоковое поле', Base64ImageField, photo),
+            (
+                'Потоковое поле, большой файл', Base64ImageField,
+                photo + bytes(settings.RECIPE_IMAGE_MAX_SIZE),
+            ),
+            (
+                'Потоковое поле, большие размеры', Base64ImageField,
+                self.resized_png(photo, 8000, 8000),
+            ),
+        ]
+        for label, field_class, content in cases:
+            data = self.data_url(content)
+
+            def decode(_):
+                try:
+                    file = field_class().to_internal_value(data)
+                except ValidationError:
+                    return
+                file.close()
+
+            self.peak(label, decode)
+            self.report(label, decode, range(min(repeat, 20)))
+        self.peak('POST /api/recipes/', self.create_recipe(photo))
+
+    def create_recipe(self, content):
+        """Вызов создания рецепта с изображением content, с откатом."""
+        user = User.objects.first()
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.first()
+        if user is None or tag is None or ingredient is None:
+            raise CommandError('Нет пользователей, тегов или инградиентов.')
+        path = reverse('recipe-list')
+        match = resolve(path)
+        request = APIRequestFactory().post(path, {
+            'name': 'benchmark-upload',
+            'text': 'benchmark-upload',
+            'cooking_time': 1,
+            'tags': [tag.id],
+            'ingredients': [{'id': ingredient.id, 'amount': 1}],
+            'image': self.data_url(content),
+        }, format='json')
+        force_authenticate(request, user=user)
+
+        def call(_):
+            with transaction.atomic():
+                response = match.func(request)
+                transaction.set_rollback(True)
+            if response.status_code != 201:
+                raise CommandError(f'Статус {response.status_code}.')
+            # Пока копий нет, в image адрес оригинала.
+            default_storage.delete(
+                response.data['image'][len(settings.MEDIA_URL):]
+            )
+        return call
+
+    def peak(self, label, func):
+        """Наибольший объем памяти Python, выделенной за вызов func."""
+        tracemalloc.start()
+        try:
+            func(None)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.stdout.write(
+            f'{label:<40} пик памяти {peak / 1024 / 1024:8.1f} МБ'
+        )
+
+    def data_url(self, content):
+        return 'data:image/png;base64,' + base64.b64encode(content).decode()
+
+    def resized_png(self, content, width, height):
+        """PNG content с другими размерами в заголовке."""
+        header = struct.pack('>II', width, height) + content[24:29]
+        return b''.join([
+            content[:16], header,
+            struct.pack('>I', zlib.crc32(b'IHDR' + header)), content[33:],
+        ])
+
+    def explain(self, statements):
+        """Планы выполненных запросов."""
+        prefix = connection.ops.explain_query_prefix()
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(f'{prefix} {sql}')
+                for row in cursor.fetchall():
+                    self.stdout.write('    ' + ' '.join(map(str, row)))
+                self.stdout.write('')
@@ -0,0 +1,98 @@
+import posixpath
+from collections import Counter
+from datetime import timedelta
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from recipes.models import Recipe, RecipeImageTask
+
+from api import images
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    ''' Удаление изображений рецептов без ссылок '''
+    help = (
+        'Считает ссылки рецептов и очереди изображений на файлы '
+        'изображений и удаляет файлы без ссылок вместе с их копиями.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=60 * 60,
+            help='Не трогать файлы моложе стольких секунд: ссылка на '
+                 'только что сохраненный файл может быть еще не записана.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено.'
+        )
+
+    def handle(self, *args, **options):
+        self.storage = Recipe.image.field.storage
+        self.cutoff = timezone.now() - timedelta(seconds=options['grace'])
+        self.dry_run = options['dry_run']
+        self.deleted = self.freed = 0
+        originals, variants = [], []
+        for name in self.walk(Recipe.image.field.upload_to):
+            if name.startswith(images.VARIANTS + '/'):
+                variants.append(name)
+            else:
+                originals.append(name)
+        names = iter(originals)
+        kept = set()
+        references = 0
+        while True:
+            batch = list(islice(names, BATCH_SIZE))
+            if not batch:
+                break
+            counts = Counter(
+                Recipe.objects.filter(image__in=batch)
+                .values_list('image', flat=True)
+            )
+            counts.update(
+                RecipeImageTask.objects.filter(image__in=batch)
+                .values_list('image', flat=True)
+            )
+            references += sum(counts.values())
+            for name in batch:
+                if counts[name] or not self.delete(name):
+                    kept.add(self.stem(name))
+        for name in variants:
+            if self.stem(name).rsplit('-', 1)[0] not in kept:
+                self.delete(name)
+        self.stdout.write(
+            f'Изображений: {len(originals)}, ссылок на них: {references}, '
+            f'копий: {len(variants)}.'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Будет удалено" if self.dry_run else "Удалено"} файлов: '
+            f'{self.deleted}, {self.freed / 1024 / 1024:.1f} МБ.'
+        ))
+
+    def walk(self, directory):
+        directories, files = self.storage.listdir(directory)
+        for name in files:
+            yield posixpath.join(directory, name)
+        for name in directories:
+            yield from self.walk(posixpath.join(directory, name))
+
+    def stem(self, name):
+        return posixpath.splitext(posixpath.basename(name))[0]
+
+    def delete(self, name):
+        """Удаляет файл, если он старше --grace; True, если удален."""
+        # Дата проверяется последней и под блокировкой хранилища: оно
+        # обновляет ее под той же блокировкой, когда отдает файл новому
+        # рецепту, и не может сделать это между проверкой и удалением.
+        with self.storage.lock():
+            if self.storage.get_modified_time(name) > self.cutoff:
+                return False
+            size = self.storage.size(name)
+            if not self.dry_run:
+                self.storage.delete(name)
+        self.deleted += 1
+        self.freed += size
+        return True
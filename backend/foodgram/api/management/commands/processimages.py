@@ -0,0 +1,74 @@
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from recipes.models import Recipe, RecipeImageTask
+
+from api import images, recipe_cache
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    ''' Уменьшенные копии изображений рецептов '''
+    help = (
+        'Разбирает очередь изображений рецептов: пишет копии в размерах '
+        'и форматах api.images. Без --once работает постоянно.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Разобрать очередь и завершиться.'
+        )
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='Поставить в очередь рецепты без копий, например после '
+                 'загрузки данных.'
+        )
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument(
+            '--interval', type=float, default=2,
+            help='Пауза в секундах, когда очередь пуста.'
+        )
+
+    def handle(self, *args, **options):
+        if options['missing']:
+            self.enqueue_missing()
+        processed = 0
+        while True:
+            done, errors = images.process_pending(options['batch_size'])
+            for recipe_id in done:
+                recipe_cache.bump('recipe', recipe_id)
+            for task, error in errors:
+                self.stderr.write(
+                    f'Рецепт {task.recipe_id}, {task.image}: {error}'
+                )
+            processed += len(done)
+            if done or errors:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {processed}.'
+        ))
+
+    def enqueue_missing(self):
+        recipes = Recipe.objects.exclude(image='').exclude(
+            processed_image=F('image')
+        ).exclude(
+            id__in=RecipeImageTask.objects.values('recipe')
+        ).values_list('id', 'image').iterator()
+        total = 0
+        while True:
+            batch = [
+                RecipeImageTask(recipe_id=pk, image=image)
+                for pk, image in islice(recipes, BATCH_SIZE)
+            ]
+            if not batch:
+                break
+            RecipeImageTask.objects.bulk_create(batch)
+            total += len(batch)
+        self.stdout.write(f'Поставлено в очередь: {total}.')
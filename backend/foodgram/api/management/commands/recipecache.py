@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from api import recipe_cache
+
+
+class Command(BaseCommand):
+    ''' Статистика кэша карточек рецептов '''
+    help = (
+        'Показывает число попаданий и промахов кэша карточек рецептов '
+        'с последнего сброса. Счетчики других процессов доходят до '
+        'кэша с задержкой до минуты.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Сбросить счетчики после вывода.'
+        )
+
+    def handle(self, *args, **options):
+        stats = recipe_cache.stats()
+        total = stats['hits'] + stats['misses']
+        self.stdout.write(
+            'Попаданий: {hits}, промахов: {misses}, доля попаданий: '
+            '{ratio:.1%}'.format(ratio=stats['hits'] / total if total else 0,
+                                 **stats)
+        )
+        if options['reset']:
+            recipe_cache.reset_stats()
+            self.stdout.write('Счетчики сброшены.')
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Sum
+from recipes.models import ShoppingCart, ShoppingListItem, User
+
+from api import shopping_list
+
+
+class Command(BaseCommand):
+    ''' Сверка и пересборка сумм списков покупок '''
+    help = (
+        'Сравнивает суммы инградиентов в списках покупок с суммами по '
+        'рецептам в корзинах и исправляет расхождения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Только проверить, ничего не меняя.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        user_ids = User.objects.order_by('id').values_list('id', flat=True)
+        mismatches = 0
+        for start in range(0, user_ids.count(), options['batch_size']):
+            batch = list(user_ids[start:start + options['batch_size']])
+            with transaction.atomic():
+                changes = self.differences(batch)
+                mismatches += len(changes)
+                if not options['verify']:
+                    shopping_list.apply(changes)
+        if options['verify'] and mismatches:
+            raise CommandError(f'Расхождений: {mismatches}.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Расхождений: {mismatches}.'
+            + ('' if options['verify'] or not mismatches else ' Исправлено.')
+        ))
+
+    def differences(self, user_ids):
+        """{(пользователь, инградиент): недостающее количество}."""
+        expected = {
+            (row['user_id'], row['ingredient_id']): row['amount']
+            for row in ShoppingCart.objects
+            .filter(
+                user_id__in=user_ids,
+                recipe__recipe_ingredients__isnull=False,
+            )
+            .values(
+                'user_id',
+                ingredient_id=F('recipe__recipe_ingredients__ingredient_id'),
+            )
+            .annotate(amount=Sum('recipe__recipe_ingredients__amount'))
+            .order_by()
+        }
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in ShoppingListItem.objects
+            .select_for_update()
+            .filter(user_id__in=user_ids)
+            .values_list('user_id', 'ingredient_id', 'amount')
+        }
+        changes = {}
+        for key in expected.keys() | stored.keys():
+            delta = expected.get(key, 0) - stored.get(key, 0)
+            if delta:
+                changes[key] = delta
+        return changes
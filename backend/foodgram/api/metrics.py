@@ -0,0 +1,293 @@
+"""
+Замеры запросов к API.
+
+MetricsMiddleware измеряет каждый запрос: время ответа, число и время
+SQL-запросов и размер ответа. Замеры уходят клиенту в заголовке
+Server-Timing, запросы дольше SLOW_REQUEST_MS пишутся в лог api.metrics
+вместе с самыми долгими SQL-запросами, а гистограммы по маршруту
+(recipe-list, recipe-download-shopping-cart) и методу копятся в процессе.
+
+SQL-запросы считает обертка execute_wrapper, которая ставится на каждое
+подключение один раз и работает без DEBUG. Потоковые ответы (списки
+покупок) учитываются, когда поток отдан до конца: их SQL-запросы
+выполняются во время отдачи.
+
+Раз в FLUSH_INTERVAL секунд процесс кладет свои гистограммы в кэш state
+целиком, одной записью, а /api/metrics/ складывает записи всех процессов
+и отдает их в текстовом формате Prometheus. Процесс находят по слоту:
+он занимает первый свободный номер через add, который из одновременных
+вызовов успешен ровно у одного, а SLOTS - наибольший занятый номер.
+Записи и слоты процессов, которые больше не пишут, живут
+PROCESS_TIMEOUT секунд, затем номер занимает новый процесс.
+"""
+import heapq
+import logging
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'foodgram_'
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+HISTOGRAMS = {
+    'request_duration_seconds': ('Время ответа.', DURATION_BUCKETS),
+    'request_db_duration_seconds': (
+        'Время SQL-запросов ответа.', DURATION_BUCKETS
+    ),
+    'request_queries': ('Число SQL-запросов ответа.', QUERY_BUCKETS),
+    'response_size_bytes': ('Размер тела ответа.', SIZE_BUCKETS),
+}
+# Прочие методы считаются под одной меткой other.
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+# Сколько самых долгих SQL-запросов пишется в лог медленного запроса.
+SLOWEST_QUERIES = 3
+FLUSH_INTERVAL = 15
+PROCESS_TIMEOUT = 24 * 60 * 60
+SLOTS = 'metrics:slots'
+
+_current = ContextVar('metrics_request', default=None)
+_lock = threading.Lock()
+# (метрика, маршрут, метод): [счетчики корзин и +Inf, сумма].
+_histograms = {}
+# (маршрут, метод, статус): число ответов.
+_requests = {}
+_flushed_at = time.monotonic()
+_process_key = f'metrics:process:{socket.gethostname()}:{os.getpid()}'
+_slot = None
+
+
+class RequestStats:
+    """SQL-запросы одного запроса к API."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest = []
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        entry = (duration, self.queries, sql)
+        if len(self.slowest) < SLOWEST_QUERIES:
+            heapq.heappush(self.slowest, entry)
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - started)
+
+
+def install_wrapper(sender, connection, **kwargs):
+    """Обертка ставится при подключении; повторное подключение - без нее."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_wrapper)
+
+
+def route(request):
+    """Имя маршрута; неизвестные пути - одной меткой, а не по пути."""
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unmatched'
+
+
+def observe(name, labels, value):
+    buckets = HISTOGRAMS[name][1]
+    key = (name, *labels)
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = _histograms[key] = [[0] * (len(buckets) + 1), 0]
+    histogram[0][bisect_left(buckets, value)] += 1
+    histogram[1] += value
+
+
+def record(request, response, stats, size):
+    """Добавляет замер запроса к гистограммам процесса и пишет лог."""
+    duration = time.perf_counter() - stats.started
+    labels = (
+        route(request),
+        request.method if request.method in METHODS else 'other',
+    )
+    with _lock:
+        observe('request_duration_seconds', labels, duration)
+        observe('request_db_duration_seconds', labels, stats.db_time)
+        observe('request_queries', labels, stats.queries)
+        if size is not None:
+            observe('response_size_bytes', labels, size)
+        key = (*labels, str(response.status_code))
+        _requests[key] = _requests.get(key, 0) + 1
+    if duration * 1000 >= settings.SLOW_REQUEST_MS:
+        logger.warning(
+            'Медленный запрос %s %s (%s): %.0f мс, SQL-запросов %d за '
+            '%.1f мс, ответ %s байт%s',
+            request.method, request.get_full_path(), labels[0],
+            duration * 1000, stats.queries, stats.db_time * 1000,
+            size if size is not None else '?',
+            ''.join(
+                f'\n  {query_time * 1000:.1f} мс: {sql[:500]}'
+                for query_time, _, sql in sorted(stats.slowest, reverse=True)
+            ),
+        )
+    if time.monotonic() - _flushed_at >= FLUSH_INTERVAL:
+        flush()
+
+
+def flush():
+    """Кладет гистограммы процесса в общий кэш."""
+    global _flushed_at
+    _flushed_at = time.monotonic()
+    with _lock:
+        state = {
+            'histograms': {
+                key: [list(counts), total]
+                for key, (counts, total) in _histograms.items()
+            },
+            'requests': dict(_requests),
+        }
+    caches['state'].set(_process_key, state, timeout=PROCESS_TIMEOUT)
+    register()
+
+
+def slot_key(number):
+    return f'metrics:slot:{number}'
+
+
+def register():
+    """Продлевает слот процесса или занимает первый свободный."""
+    global _slot
+    store = caches['state']
+    if _slot is not None and store.get(slot_key(_slot)) == _process_key:
+        store.touch(slot_key(_slot), PROCESS_TIMEOUT)
+        return
+    number = 1
+    while not store.add(
+        slot_key(number), _process_key, timeout=PROCESS_TIMEOUT
+    ):
+        if store.get(slot_key(number)) == _process_key:
+            break
+        number += 1
+    _slot = number
+    store.add(SLOTS, 0, timeout=None)
+    while store.get(SLOTS) < number:
+        store.incr(SLOTS)
+
+
+def collect():
+    """Гистограммы и счетчики ответов всех процессов, сложенные."""
+    store = caches['state']
+    slots = store.get_many(
+        [slot_key(number) for number in range(1, store.get(SLOTS, 0) + 1)]
+    )
+    states = store.get_many(set(slots.values()))
+    histograms = {}
+    requests = {}
+    for state in states.values():
+        for key, (counts, total) in state['histograms'].items():
+            merged = histograms.setdefault(key, [[0] * len(counts), 0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+        for key, count in state['requests'].items():
+            requests[key] = requests.get(key, 0) + count
+    return histograms, requests
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def exposition():
+    """Текст для Prometheus по сложенным замерам всех процессов."""
+    flush()
+    histograms, requests = collect()
+    lines = [
+        f'# HELP {PREFIX}requests_total Число ответов.',
+        f'# TYPE {PREFIX}requests_total counter',
+    ]
+    for (name, method, status), count in sorted(requests.items()):
+        lines.append(
+            f'{PREFIX}requests_total{{route="{escape(name)}",'
+            f'method="{method}",status="{status}"}} {count}'
+        )
+    for metric, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [
+            f'# HELP {PREFIX}{metric} {help_text}',
+            f'# TYPE {PREFIX}{metric} histogram',
+        ]
+        for (name, *labels), (counts, total) in sorted(histograms.items()):
+            if name != metric:
+                continue
+            label = f'route="{escape(labels[0])}",method="{labels[1]}"'
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(
+                    f'{PREFIX}{metric}_bucket{{{label},le="{bound}"}} '
+                    f'{cumulative}'
+                )
+            lines += [
+                f'{PREFIX}{metric}_sum{{{label}}} {total}',
+                f'{PREFIX}{metric}_count{{{label}}} {cumulative}',
+            ]
+    return '\n'.join(lines) + '\n'
+
+
+def counted(content, request, response, stats):
+    """Отдает поток ответа и учитывает запрос, когда поток закончен."""
+    size = 0
+    token = _current.set(stats)
+    try:
+        for chunk in content:
+            size += len(chunk)
+            yield chunk
+    finally:
+        _current.reset(token)
+        record(request, response, stats, size)
+
+
+class MetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        response['Server-Timing'] = (
+            'app;dur={:.1f}, db;dur={:.1f};desc="{} queries"'.format(
+                (time.perf_counter() - stats.started) * 1000,
+                stats.db_time * 1000, stats.queries,
+            )
+        )
+        if response.streaming:
+            response.streaming_content = counted(
+                response.streaming_content, request, response, stats
+            )
+        else:
+            record(request, response, stats, len(response.content))
+        return response
@@ -1,6 +1,73 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import Paginator
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class FoodgramPaginator(Paginator):
+    """
+    Число строк считается без аннотаций: Django 2.2 с любой аннотацией
+    считает COUNT(*) по подзапросу с GROUP BY. Фильтры по аннотациям
+    уже стоят в WHERE целиком, поэтому без агрегатов число строк то же.
+    """
+
+    @cached_property
+    def count(self):
+        if not isinstance(self.object_list, QuerySet):
+            return super().count
+        query = self.object_list.query
+        if not query.annotations or any(
+            annotation.contains_aggregate
+            for annotation in query.annotations.values()
+        ):
+            return super().count
+        query = query.chain()
+        query.annotations.clear()
+        query.set_annotation_mask(None)
+        return query.get_count(using=self.object_list.db)
+
+
+class FoodgramCursorPagination(CursorPagination):
+    """
+    Страницы по курсору: следующая страница выбирается условием на ключ
+    последней записи, без OFFSET и COUNT(*). Порядок задает view в
+    атрибуте cursor_ordering.
+    """
+    page_size_query_param = 'limit'
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'cursor_ordering', self.ordering)
+
+    def decode_cursor(self, request):
+        # Пустой cursor= включает режим курсора с первой страницы.
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super().decode_cursor(request)
 
 
 class FoodgramPagination(PageNumberPagination):
-    """Переопределяю параметры стандартного пагинатора"""
+    """
+    Переопределяю параметры стандартного пагинатора.
+    С параметром cursor страницы отдаются по курсору, если view задает
+    cursor_ordering.
+    """
+    django_paginator_class = FoodgramPaginator
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_pagination = None
+        if (
+            self.cursor_query_param in request.query_params
+            and getattr(view, 'cursor_ordering', None) is not None
+        ):
+            self.cursor_pagination = FoodgramCursorPagination()
+            return self.cursor_pagination.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_pagination is not None:
+            return self.cursor_pagination.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,22 @@
+from django.conf import settings
+from rest_framework import exceptions, parsers, status
+
+
+class RequestTooLarge(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Слишком большой запрос.'
+    default_code = 'request_too_large'
+
+
+class JSONParser(parsers.JSONParser):
+    """
+    JSON с ограничением размера: тело больше JSON_MAX_BODY_SIZE
+    отклоняется по заголовку Content-Length, не читаясь в память.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if length > settings.JSON_MAX_BODY_SIZE:
+            raise RequestTooLarge()
+        return super().parse(stream, media_type, parser_context)
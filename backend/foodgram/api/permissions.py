@@ -27,3 +27,11 @@ class IsAuthenticatedForDetail(permissions.BasePermission):
         ):
             return True
         return False
+
+
+class IsAdmin(permissions.BasePermission):
+    """Разрешение только для администраторов."""
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and (
+            request.user.is_admin or request.user.is_staff
+        )
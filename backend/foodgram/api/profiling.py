@@ -0,0 +1,124 @@
+"""
+Профилирование отдельных запросов.
+
+Администратор (User.is_admin или is_staff) добавляет к запросу заголовок
+X-Profile: 1 или параметр profile=1, и запрос выполняется под cProfile,
+а его SQL-запросы записываются с временем, но без параметров: в них
+бывают токены и хэши паролей. Профиль и SQL сохраняются в RequestProfile
+и скачиваются из админки; ответ получает заголовок X-Profile со ссылкой
+на запись. Если PROFILE_SAMPLE_RATE больше нуля, такая же доля всех
+запросов профилируется в фоне.
+
+Остальные запросы проходят без замеров: проверяется только флаг, а
+пользователь по токену ищется лишь для запроса с флагом. Потоковый ответ
+профилируется до начала отдачи. Хранятся последние PROFILE_KEEP
+профилей.
+"""
+import cProfile
+import marshal
+import pstats
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.urls import reverse
+from recipes.models import RequestProfile
+from rest_framework.exceptions import AuthenticationFailed
+
+from api import metrics
+from api.authentication import CachedTokenAuthentication
+
+
+def flagged(request):
+    return (
+        request.META.get('HTTP_X_PROFILE') == '1'
+        or request.GET.get('profile') == '1'
+    )
+
+
+def staff_user(request):
+    """Администратор из сессии или токена; иначе None."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            result = CachedTokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return None
+        user = result[0] if result else None
+    if user is not None and (
+        getattr(user, 'is_admin', False) or user.is_staff
+    ):
+        return user
+    return None
+
+
+class ProfilingMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if flagged(request):
+            user = staff_user(request)
+            if user is None:
+                return self.get_response(request)
+            return self.profile(request, user, sampled=False)
+        if (
+            settings.PROFILE_SAMPLE_RATE
+            and random.random() < settings.PROFILE_SAMPLE_RATE
+        ):
+            return self.profile(request, None, sampled=True)
+        return self.get_response(request)
+
+    def profile(self, request, user, sampled):
+        queries = []
+
+        def capture(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append((time.perf_counter() - started, sql))
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(capture)
+                )
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - started
+        record = RequestProfile.objects.create(
+            user=user,
+            method=request.method[:10],
+            path=request.get_full_path()[:2000],
+            route=metrics.route(request)[:200],
+            status_code=response.status_code,
+            duration=duration * 1000,
+            query_count=len(queries),
+            sampled=sampled,
+            # Формат файла pstats: читается pstats.Stats, snakeviz,
+            # gprof2dot.
+            profile=marshal.dumps(pstats.Stats(profiler).stats),
+            queries=''.join(
+                f'-- {query_time * 1000:.1f} мс\n{sql};\n\n'
+                for query_time, sql in queries
+            ),
+        )
+        stale = RequestProfile.objects.order_by('-id').values_list(
+            'id', flat=True
+        )[settings.PROFILE_KEEP:settings.PROFILE_KEEP + 1]
+        if stale:
+            RequestProfile.objects.filter(id__lte=stale[0]).delete()
+        if not sampled:
+            response['X-Profile'] = reverse(
+                'admin:recipes_requestprofile_change', args=[record.pk]
+            )
+        return response
@@ -0,0 +1,184 @@
+"""
+Кэш карточек рецептов.
+
+Карточка - вывод RecipeGetSerializer без отметок пользователя; она
+одинакова для всех и кэшируется по версиям рецепта, автора и
+справочников тегов и инградиентов. Версии меняются после изменения
+рецепта, профиля автора, тега или инградиента, и старые карточки
+больше не читаются. Отметки is_favorited, is_in_shopping_cart и
+author.is_subscribed берутся из аннотаций запроса страницы и
+подставляются в карточку при ответе.
+
+Карточки лежат в кэше cards, который при переполнении вытесняет
+записи, а версии - в кэше state, который их не вытесняет: потеря версии
+сбросила бы разом все карточки, построенные на ней.
+
+Число попаданий и промахов копится в процессе и раз в STATS_INTERVAL
+секунд добавляется к общим счетчикам в state атомарным incr; по ним
+подбирается размер кэша, см. команду recipecache.
+"""
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Prefetch
+from recipes.models import Recipe, RecipeIngredients, User
+
+from api import catalog, replicas
+from api.serializers import RecipeGetSerializer
+
+HITS = 'recipe-card:hits'
+MISSES = 'recipe-card:misses'
+STATS_INTERVAL = 60
+
+_pending = Counter()
+_flushed_at = time.monotonic()
+
+
+def version_key(kind, pk):
+    return f'recipe-card:{kind}:{pk}:version'
+
+
+def bump(kind, pk):
+    """Новая версия рецепта (kind='recipe') или автора (kind='author')."""
+    caches['state'].set(version_key(kind, pk), time.time_ns(), timeout=None)
+
+
+def forget(kind, ids):
+    """
+    Сбрасывает версии многих рецептов или авторов сразу: следующее
+    чтение создаст новые. Для массовых вставок, где bump на id дорог.
+    """
+    caches['state'].delete_many([version_key(kind, pk) for pk in ids])
+
+
+def versions(keys):
+    """Версии по ключам; недостающие создаются заново."""
+    found = caches['state'].get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in found}
+    if missing:
+        caches['state'].set_many(missing, timeout=None)
+    return {**found, **missing}
+
+
+def card_keys(recipes):
+    """Ключи карточек рецептов по текущим версиям."""
+    current = versions(
+        [version_key('recipe', recipe.id) for recipe in recipes]
+        + [version_key('author', recipe.author_id) for recipe in recipes]
+    )
+    catalogs = (
+        f'{catalog.version(catalog.TAGS)}:'
+        f'{catalog.version(catalog.INGREDIENTS)}'
+    )
+    return {
+        recipe.id: 'recipe-card:{}:{}:{}:{}'.format(
+            recipe.id,
+            current[version_key('recipe', recipe.id)],
+            current[version_key('author', recipe.author_id)],
+            catalogs,
+        )
+        for recipe in recipes
+    }
+
+
+def load_cards(ids, context):
+    """
+    Карточки рецептов ids: теги, инградиенты и авторы одним запросом.
+    Карточки попадают в общий кэш, поэтому читаются с основной базы.
+    """
+    with replicas.primary():
+        return _load_cards(ids, context)
+
+
+def _load_cards(ids, context):
+    recipes = Recipe.objects.defer('search_vector').filter(
+        id__in=ids
+    ).prefetch_related(
+        Prefetch('author', queryset=User.objects.all()),
+        'tags',
+        Prefetch(
+            'recipe_ingredients',
+            queryset=RecipeIngredients.objects.select_related('ingredient')
+        ),
+    )
+    for recipe in recipes:
+        # Отметки подставляются при ответе, в карточке они пустые.
+        recipe.user_favorites = []
+        recipe.user_shopping_carts = []
+        recipe.author.is_subscribed = False
+    return {
+        card['id']: card
+        for card in RecipeGetSerializer(
+            recipes, many=True, context=context
+        ).data
+    }
+
+
+def count(hits, misses):
+    _pending.update({HITS: hits, MISSES: misses})
+    if time.monotonic() - _flushed_at >= STATS_INTERVAL:
+        flush_stats()
+
+
+def flush_stats():
+    """Добавляет счетчики процесса к общим."""
+    global _flushed_at
+    for key, delta in _pending.items():
+        if delta:
+            caches['state'].add(key, 0, timeout=None)
+            caches['state'].incr(key, delta)
+    _pending.clear()
+    _flushed_at = time.monotonic()
+
+
+def cards(recipes, context):
+    """
+    Вывод RecipeGetSerializer для рецептов страницы. Отметки берутся
+    из аннотаций рецептов, см. RecipeViewSet.get_queryset. Рецепты,
+    удаленные после запроса страницы, пропускаются.
+    """
+    keys = card_keys(recipes)
+    found = caches['cards'].get_many(keys.values())
+    result = {
+        pk: found[key] for pk, key in keys.items() if key in found
+    }
+    missing = [pk for pk in keys if pk not in result]
+    if missing:
+        loaded = load_cards(missing, context)
+        caches['cards'].set_many(
+            {keys[pk]: card for pk, card in loaded.items()},
+            timeout=settings.RECIPE_CARD_CACHE_TIMEOUT,
+        )
+        result.update(loaded)
+    count(len(keys) - len(missing), len(missing))
+    data = []
+    for recipe in recipes:
+        card = result.get(recipe.id)
+        if card is None:
+            # Рецепт удален после запроса страницы.
+            continue
+        card['is_favorited'] = getattr(recipe, 'is_favorited', False)
+        card['is_in_shopping_cart'] = getattr(
+            recipe, 'is_in_shopping_cart', False
+        )
+        card['author']['is_subscribed'] = getattr(
+            recipe, 'author_is_subscribed', False
+        )
+        data.append(card)
+    return data
+
+
+def stats():
+    """Попадания и промахи с последнего сброса."""
+    flush_stats()
+    return {
+        'hits': caches['state'].get(HITS, 0),
+        'misses': caches['state'].get(MISSES, 0),
+    }
+
+
+def reset_stats():
+    _pending.clear()
+    caches['state'].delete_many([HITS, MISSES])
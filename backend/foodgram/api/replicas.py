@@ -0,0 +1,91 @@
+"""
+Чтение с реплик базы.
+
+Безопасные запросы к представлениям с read_from_replica = True читают
+модели приложения recipes с одной из реплик DATABASE_REPLICAS, все
+остальное идет в основную базу. После запроса на запись клиент на
+REPLICA_PIN_SECONDS остается на основной базе: реплика может отставать,
+а клиент должен сразу видеть свое избранное и корзину. Клиент узнается
+по заголовку Authorization, поэтому закрепление общее для всех
+воркеров и не требует запроса к базе.
+
+Все, что кладется в общий кэш (карточки рецептов, ответы справочников,
+индекс инградиентов), читается из основной базы внутри primary():
+отставшая реплика иначе попала бы в кэш под новой версией.
+"""
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+@contextmanager
+def primary():
+    """Чтение внутри блока идет в основную базу."""
+    token = _use_replica.set(False)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def pin_key(authorization):
+    """Ключ закрепления клиента по заголовку Authorization."""
+    if not authorization:
+        return None
+    digest = hashlib.sha256(authorization.encode()).hexdigest()
+    return f'replica-pin:{digest}'
+
+
+class ReplicaMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _use_replica.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+        key = pin_key(request.META.get('HTTP_AUTHORIZATION'))
+        if request.method not in SAFE_METHODS and key:
+            cache.set(key, True, timeout=settings.REPLICA_PIN_SECONDS)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method in SAFE_METHODS
+            and getattr(
+                getattr(view_func, 'cls', None), 'read_from_replica', False
+            )
+        ):
+            key = pin_key(request.META.get('HTTP_AUTHORIZATION'))
+            _use_replica.set(key is None or not cache.get(key))
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and model._meta.app_label == 'recipes':
+            return random.choice(settings.DATABASE_REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной базы.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
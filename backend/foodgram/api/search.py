@@ -0,0 +1,60 @@
+"""
+Полнотекстовый поиск рецептов по названию и описанию.
+
+На PostgreSQL запрос сравнивается с поисковым вектором рецепта, который
+поддерживает триггер, и находится по GIN-индексу; ранг считается по
+тому же вектору, без разбора текста. На других базах (SQLite в
+разработке) каждое слово запроса ищется в названии или описании, а
+совпадение в названии весит больше. SQLite сравнивает без учета
+регистра только латиницу, поэтому слово ищется еще строчными буквами и
+с заглавной.
+"""
+from functools import reduce
+from operator import add, and_, or_
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import Case, F, FloatField, Q, Value, When
+
+CONFIG = 'russian'
+RANK = 'search_rank'
+ORDERING = ('-' + RANK, '-created_at', '-id')
+
+
+def search(queryset, text):
+    """Рецепты по запросу text в порядке ранга, с рангом в search_rank."""
+    words = text.split()
+    if not words:
+        return queryset
+    if connections[queryset.db].vendor == 'postgresql':
+        query = SearchQuery(text, config=CONFIG)
+        queryset = queryset.annotate(**{
+            RANK: SearchRank(F('search_vector'), query)
+        }).filter(search_vector=query)
+    else:
+        queryset = queryset.annotate(**{
+            RANK: reduce(add, (
+                weight(contains('name', word), 1.0)
+                + weight(contains('text', word), 0.4)
+                for word in words
+            ))
+        }).filter(reduce(and_, (
+            contains('name', word) | contains('text', word)
+            for word in words
+        )))
+    return queryset.order_by(*ORDERING)
+
+
+def contains(field, word):
+    return reduce(or_, (
+        Q(**{f'{field}__icontains': form})
+        for form in dict.fromkeys([word, word.lower(), word.capitalize()])
+    ))
+
+
+def weight(condition, value):
+    return Case(
+        When(condition, then=Value(value)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
@@ -1,8 +1,8 @@
+from api import images, shopping_list
+from api.fields import Base64ImageField
 from api.validators import validate_cooking_time, validate_username
-from django.core.exceptions import ObjectDoesNotExist
 from django.db import transaction
-from drf_extra_fields.fields import Base64ImageField
-from foodgram import settings
+from django.db.models import Prefetch, prefetch_related_objects
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredients,
                             ShoppingCart, Subscription, Tag, User)
 from rest_framework import serializers
@@ -46,6 +46,8 @@ class UserSerializer(serializers.ModelSerializer):
         """Получение наличия в подписках"""
         user = self.context['request'].user
         if user.is_authenticated:
+            if hasattr(obj, 'is_subscribed'):
+                return obj.is_subscribed
             return (Subscription.objects
                     .filter(user=user)
                     .filter(author=obj)
@@ -54,7 +56,8 @@ class UserSerializer(serializers.ModelSerializer):
 
     @transaction.atomic
     def create(self, validated_data):
-        user = super().create(validated_data)
+        # Пароль хэшируется до вставки: пользователь пишется один раз.
+        user = User(**validated_data)
         user.set_password(validated_data['password'])
         user.save()
         return user
@@ -154,41 +157,67 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         return obj.ingredient.measurement_unit
 
 
-class IngredientWriteField(serializers.RelatedField):
-    """Поле для инградиента в сериализаторе записи рецепта."""
-    def to_representation(self, value):
-        """Функция получения значения из базы."""
-        return value
-
-    def to_internal_value(self, data):
-        """Функция записи значения в базу."""
-        try:
-            ingredient = Ingredient.objects.get(id=data['id'])
-        except ObjectDoesNotExist:
-            raise serializers.ValidationError({'id': 'doesnt exists'})
-        return RecipeIngredients.objects.create(
-            ingredient=ingredient,
-            amount=data['amount'],
-        )
+class IngredientWriteSerializer(serializers.Serializer):
+    """Инградиент в сериализаторе записи рецепта."""
+    id = serializers.IntegerField()
+    amount = serializers.IntegerField(min_value=1, max_value=32767)
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
-    """Сериализатор для изменения рецептов."""
-    tags = serializers.SlugRelatedField(
-        many=True,
-        queryset=Tag.objects.all(),
-        slug_field='id'
-    )
-    ingredients = IngredientWriteField(
-        many=True,
-        queryset=RecipeIngredients.objects.all(),
-    )
+    """
+    Сериализатор для изменения рецептов.
+    Теги и инградиенты проверяются одним запросом на список, строки
+    пишутся пачками; при изменении пишутся только изменившиеся строки.
+    """
+    tags = serializers.ListField(child=serializers.IntegerField())
+    ingredients = IngredientWriteSerializer(many=True)
     author = UserSerializer(required=False)
-    image = Base64ImageField()
+    image = Base64ImageField(required=False)
     cooking_time = serializers.IntegerField(
         validators=[validate_cooking_time]
     )
 
+    def validate_tags(self, value):
+        found = set(
+            Tag.objects.filter(id__in=value).values_list('id', flat=True)
+        )
+        missing = [pk for pk in value if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                f'Недопустимый первичный ключ "{missing[0]}" - '
+                'объект не существует.'
+            )
+        return list(dict.fromkeys(value))
+
+    def validate_ingredients(self, value):
+        ids = [ingredient['id'] for ingredient in value]
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError(
+                'Инградиенты не должны повторяться.'
+            )
+        found = set(
+            Ingredient.objects.filter(id__in=ids).values_list('id', flat=True)
+        )
+        if len(found) != len(ids):
+            raise serializers.ValidationError({'id': 'doesnt exists'})
+        return value
+
+    def validate(self, data):
+        if self.instance is None and 'image' not in data:
+            raise serializers.ValidationError(
+                {'image': 'Обязательное поле.'}
+            )
+        return data
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            # Хранилище переносит временный файл изображения, а не читает
+            # его; закрыть файл после этого нужно явно, как FILES запроса.
+            if self.validated_data.get('image'):
+                self.validated_data['image'].close()
+
     @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
@@ -197,11 +226,83 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             author=self.context['request'].user,
             **validated_data,
         )
-        recipe.tags.set(tags)
-        recipe.ingredients.set(ingredients)
+        images.enqueue(recipe)
+        self.add_tags(recipe, tags)
+        self.add_ingredients(recipe, ingredients)
+        # Новый рецепт еще никто не добавил в избранное и в корзину.
+        recipe.user_favorites = []
+        recipe.user_shopping_carts = []
         return recipe
 
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save()
+        if 'image' in validated_data:
+            images.enqueue(instance)
+        if tags is not None:
+            current = set(instance.tags.values_list('id', flat=True))
+            instance.tags.remove(*(current - set(tags)))
+            self.add_tags(
+                instance, [pk for pk in tags if pk not in current]
+            )
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
+        return instance
+
+    def add_tags(self, recipe, tags):
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=recipe, tag_id=pk) for pk in tags
+        ])
+
+    def add_ingredients(self, recipe, ingredients):
+        RecipeIngredients.objects.bulk_create([
+            RecipeIngredients(
+                recipe=recipe,
+                ingredient_id=ingredient['id'],
+                amount=ingredient['amount'],
+            )
+            for ingredient in ingredients
+        ])
+
+    def update_ingredients(self, recipe, ingredients):
+        """Пишет только добавленные, измененные и удаленные строки."""
+        current = {
+            row.ingredient_id: row
+            for row in recipe.recipe_ingredients.all()
+        }
+        old_amounts = shopping_list.recipe_amounts(recipe, current.values())
+        new_amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed, changed = [], []
+        for ingredient_id, row in current.items():
+            if ingredient_id not in new_amounts:
+                removed.append(row.id)
+            elif row.amount != new_amounts[ingredient_id]:
+                row.amount = new_amounts[ingredient_id]
+                changed.append(row)
+        RecipeIngredients.objects.filter(id__in=removed).delete()
+        RecipeIngredients.objects.bulk_update(changed, ['amount'])
+        self.add_ingredients(recipe, [
+            ingredient for ingredient in ingredients
+            if ingredient['id'] not in current
+        ])
+        shopping_list.change_recipe(recipe, old_amounts, new_amounts)
+
     def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance],
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredients.objects.select_related('ingredient')
+            ),
+        )
         return RecipeGetSerializer(
             instance=instance,
             context=self.context
@@ -215,9 +316,12 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
 class RecipeGetSerializer(serializers.ModelSerializer):
     """Сериализатор для получения рецептов."""
     tags = TagSerializer(many=True)
-    ingredients = RecipeIngredientSerializer(many=True)
+    ingredients = RecipeIngredientSerializer(
+        many=True, source='recipe_ingredients'
+    )
     author = UserSerializer()
     image = serializers.SerializerMethodField('get_image')
+    images = serializers.SerializerMethodField('get_images')
     is_favorited = serializers.SerializerMethodField('get_favorited')
     is_in_shopping_cart = serializers.SerializerMethodField(
         'get_shopping_cart'
@@ -227,13 +331,16 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = [
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time',
+            'is_in_shopping_cart', 'name', 'image', 'images', 'text',
+            'cooking_time',
         ]
 
     def get_favorited(self, obj):
         """Получение наличия в избранном"""
         user = self.context['request'].user
         if user.is_authenticated:
+            if hasattr(obj, 'user_favorites'):
+                return bool(obj.user_favorites)
             return (Favorite.objects
                     .filter(user=user)
                     .filter(recipe=obj)
@@ -244,6 +351,8 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         """Получение наличия в корзине"""
         user = self.context['request'].user
         if user.is_authenticated:
+            if hasattr(obj, 'user_shopping_carts'):
+                return bool(obj.user_shopping_carts)
             return (ShoppingCart.objects
                     .filter(user=user)
                     .filter(recipe=obj)
@@ -251,7 +360,10 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         return False
 
     def get_image(self, obj):
-        return f'{settings.MEDIA_URL}{obj.image}'
+        return images.url(obj, images.CARD_SIZE)
+
+    def get_images(self, obj):
+        return images.urls(obj)
 
 
 class FavoriteShoppingCartSerializer(serializers.BaseSerializer):
@@ -260,7 +372,7 @@ class FavoriteShoppingCartSerializer(serializers.BaseSerializer):
         return {
             'id': instance.id,
             'name': instance.name,
-            'image': f'{settings.MEDIA_URL}{instance.image}',
+            'image': images.url(instance, images.PREVIEW_SIZE),
             'cooking_time': instance.cooking_time
         }
 
@@ -280,10 +392,13 @@ class SubscribeSerializer(UserSerializer):
 
     def get_recipes(self, obj):
         """Получение рецептов"""
-        limit = self.context['request'].query_params.get('recipes_limit')
-        query = Recipe.objects.filter(author=obj)
-        if limit is not None:
-            query = query[:int(limit)]
+        if hasattr(obj, 'preview_recipes'):
+            query = obj.preview_recipes
+        else:
+            limit = self.context['request'].query_params.get('recipes_limit')
+            query = Recipe.objects.filter(author=obj)
+            if limit is not None:
+                query = query[:int(limit)]
         recipes = FavoriteShoppingCartSerializer(
             query,
             many=True,
@@ -292,4 +407,6 @@ class SubscribeSerializer(UserSerializer):
 
     def get_recipes_count(self, obj):
         """Получение количества рецептов"""
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return Recipe.objects.filter(author=obj).count()
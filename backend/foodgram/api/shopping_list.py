@@ -0,0 +1,162 @@
+"""
+Список покупок: суммы инградиентов по рецептам в корзине и выгрузка.
+
+Суммы хранятся в ShoppingListItem и меняются в той же транзакции, что и
+корзина или инградиенты рецепта в ней, поэтому выгрузка только читает
+готовые строки. Изменения сумм одного пользователя идут по очереди:
+строк, которые еще не созданы, блокировка не коснется, поэтому
+блокируется строка пользователя. Строки читаются курсором частями и
+отдаются клиенту по мере чтения. PDF собирается во временный файл,
+который в памяти держится только пока он небольшой.
+"""
+import csv
+import tempfile
+from collections import Counter
+
+from django.conf import settings
+from recipes.models import ShoppingCart, ShoppingListItem, User
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+
+CHUNK_SIZE = 500
+PDF_FONT = 'ShoppingListFont'
+
+
+class Echo:
+    """Буфер для csv.writer, который возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def recipe_amounts(recipe, rows=None):
+    """Количество каждого инградиента в рецепте или в строках rows."""
+    if rows is None:
+        rows = recipe.recipe_ingredients.all()
+    amounts = Counter()
+    for row in rows:
+        amounts[row.ingredient_id] += row.amount
+    return amounts
+
+
+def apply(changes):
+    """
+    Изменяет суммы инградиентов.
+    changes: словарь {(id пользователя, id инградиента): прирост}.
+    """
+    changes = {key: delta for key, delta in changes.items() if delta}
+    if not changes:
+        return
+    # Порядок блокировки один для всех транзакций: без взаимных ожиданий.
+    list(
+        User.objects.select_for_update()
+        .filter(id__in={user_id for user_id, _ in changes})
+        .order_by('id')
+        .values_list('id', flat=True)
+    )
+    items = {
+        (item.user_id, item.ingredient_id): item
+        for item in ShoppingListItem.objects.select_for_update().filter(
+            user_id__in={user_id for user_id, _ in changes},
+            ingredient_id__in={ingredient_id for _, ingredient_id in changes},
+        )
+    }
+    created, updated, deleted = [], [], []
+    for (user_id, ingredient_id), delta in changes.items():
+        item = items.get((user_id, ingredient_id))
+        if item is None:
+            if delta > 0:
+                created.append(ShoppingListItem(
+                    user_id=user_id, ingredient_id=ingredient_id, amount=delta
+                ))
+            continue
+        item.amount += delta
+        if item.amount > 0:
+            updated.append(item)
+        else:
+            deleted.append(item.id)
+    ShoppingListItem.objects.bulk_create(created)
+    ShoppingListItem.objects.bulk_update(updated, ['amount'])
+    ShoppingListItem.objects.filter(id__in=deleted).delete()
+
+
+def change_cart(user, recipe, sign):
+    """Рецепт добавлен в корзину (sign=1) или убран из нее (sign=-1)."""
+    apply({
+        (user.id, ingredient_id): sign * amount
+        for ingredient_id, amount in recipe_amounts(recipe).items()
+    })
+
+
+def change_recipe(recipe, old_amounts, new_amounts=None):
+    """Инградиенты рецепта изменились: пересчет у всех, чьей он корзине."""
+    if new_amounts is None:
+        new_amounts = recipe_amounts(recipe)
+    delta = {
+        ingredient_id:
+            new_amounts.get(ingredient_id, 0)
+            - old_amounts.get(ingredient_id, 0)
+        for ingredient_id in old_amounts.keys() | new_amounts.keys()
+    }
+    if not any(delta.values()):
+        return
+    apply({
+        (user_id, ingredient_id): amount
+        for user_id in ShoppingCart.objects.filter(
+            recipe=recipe
+        ).values_list('user_id', flat=True)
+        for ingredient_id, amount in delta.items()
+    })
+
+
+def ingredients(user):
+    """Тройки (название, ед. изм., количество) по корзине пользователя."""
+    return (
+        ShoppingListItem.objects
+        .filter(user=user)
+        .order_by('ingredient__name', 'ingredient__measurement_unit')
+        .values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        )
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def csv_rows(user):
+    csv_writer = csv.writer(Echo())
+    for row in ingredients(user):
+        yield csv_writer.writerow(row)
+
+
+def txt_rows(user):
+    for name, unit, amount in ingredients(user):
+        yield f'{name} ({unit}) — {amount}\n'
+
+
+def pdf_file(user):
+    """PDF со списком покупок во временном файле, готовом к чтению."""
+    if PDF_FONT not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT, settings.SHOPPING_LIST_PDF_FONT)
+        )
+    output = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    canvas = Canvas(output, pagesize=A4)
+    width, height = A4
+    margin = 50
+    line_height = 18
+    canvas.setFont(PDF_FONT, 16)
+    canvas.drawString(margin, height - margin, 'Список покупок')
+    y = height - margin - 2 * line_height
+    canvas.setFont(PDF_FONT, 12)
+    for name, unit, amount in ingredients(user):
+        if y < margin:
+            canvas.showPage()
+            canvas.setFont(PDF_FONT, 12)
+            y = height - margin
+        canvas.drawString(margin, y, f'{name} ({unit}) — {amount}')
+        y -= line_height
+    canvas.save()
+    output.seek(0)
+    return output
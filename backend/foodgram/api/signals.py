@@ -0,0 +1,66 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from recipes.models import Ingredient, Recipe, Tag, User
+from rest_framework.authtoken.models import Token
+
+from api import (authentication, catalog, ingredient_index, recipe_cache,
+                 shopping_list)
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def ingredient_changed(**kwargs):
+    """Индекс инградиентов перестраивается после изменения каталога."""
+    ingredient_index.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_changed(**kwargs):
+    """Новая версия справочника тегов после фиксации транзакции."""
+    transaction.on_commit(partial(catalog.bump, catalog.TAGS))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_changed(instance, **kwargs):
+    """
+    Карточка рецепта собирается заново после изменения рецепта. API и
+    админка меняют теги и инградиенты рецепта только вместе с ним.
+    """
+    transaction.on_commit(partial(recipe_cache.bump, 'recipe', instance.id))
+
+
+@receiver(post_save, sender=User)
+def author_changed(instance, update_fields, **kwargs):
+    """Имя автора есть в карточках всех его рецептов."""
+    if update_fields == {'last_login'}:
+        return
+    transaction.on_commit(partial(recipe_cache.bump, 'author', instance.id))
+
+
+@receiver(post_save, sender=User)
+def user_tokens_changed(instance, created, update_fields, **kwargs):
+    """
+    Пароль, активность и профиль пользователя перечитываются из базы
+    при следующем запросе с его токенами.
+    """
+    if created or update_fields == {'last_login'}:
+        return
+    authentication.revoke(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(instance, **kwargs):
+    """Выход и удаление токена сразу отзывают его из кэша."""
+    authentication.revoke([instance.key])
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    """Удаленный рецепт убирается из сумм списков покупок."""
+    shopping_list.change_recipe(
+        instance, shopping_list.recipe_amounts(instance), {}
+    )
@@ -0,0 +1,63 @@
+"""
+Кэш версий и счетчиков не вытесняет записи, а одновременные incr и add
+из разных потоков не теряют прибавлений и не дают двух победителей.
+"""
+import shutil
+import tempfile
+import threading
+
+from django.test import SimpleTestCase
+
+from api.cache_backends import DurableFileBasedCache
+
+THREADS = 8
+ROUNDS = 20
+
+
+class DurableFileBasedCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.cache = DurableFileBasedCache(
+            directory, {'OPTIONS': {'MAX_ENTRIES': 3}}
+        )
+
+    def run_threads(self, target):
+        threads = [
+            threading.Thread(target=target, args=(i,))
+            for i in range(THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_entries_are_not_culled(self):
+        for i in range(10):
+            self.cache.set(f'version:{i}', i, timeout=None)
+        self.assertEqual(
+            self.cache.get_many([f'version:{i}' for i in range(10)]),
+            {f'version:{i}': i for i in range(10)},
+        )
+
+    def test_concurrent_incr(self):
+        self.cache.add('hits', 0, timeout=None)
+
+        def increment(_):
+            for _ in range(ROUNDS):
+                self.cache.incr('hits')
+
+        self.run_threads(increment)
+        self.assertEqual(self.cache.get('hits'), THREADS * ROUNDS)
+
+    def test_concurrent_add(self):
+        added = []
+
+        def add(number):
+            if self.cache.add('slot', number, timeout=None):
+                added.append(number)
+
+        self.run_threads(add)
+        self.assertEqual(len(added), 1)
+        self.assertEqual(self.cache.get('slot'), added[0])
@@ -0,0 +1,58 @@
+"""
+Справочники тегов и инградиентов видят данные, загруженные командами
+пачками, без сигналов модели.
+"""
+import json
+import os
+from io import StringIO
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TransactionTestCase
+from rest_framework.test import APIClient
+
+from api import ingredient_index
+from api.tests.utils import IsolatedMixin
+
+
+class BulkLoadTest(IsolatedMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        # Очистка базы между тестами идет мимо сигналов.
+        ingredient_index.rebuild()
+        # Пустые справочники попадают в кэш ответов и индекс.
+        self.assertEqual(self.names('/api/tags/'), [])
+        self.assertEqual(self.names('/api/ingredients/'), [])
+
+    def names(self, path):
+        return [item['name'] for item in self.client.get(path).json()]
+
+    def test_importrecipes(self):
+        path = os.path.join(self.directory, 'export.ndjson')
+        with open(path, 'w', encoding='utf-8') as export:
+            for record in (
+                {'type': 'tag', 'name': 'Обед', 'slug': 'lunch',
+                 'color': '#000000'},
+                {'type': 'ingredient', 'name': 'Соль',
+                 'measurement_unit': 'г'},
+            ):
+                export.write(json.dumps(record, ensure_ascii=False) + '\n')
+        call_command('importrecipes', path, stdout=StringIO())
+        self.assertEqual(self.names('/api/tags/'), ['Обед'])
+        self.assertEqual(self.names('/api/ingredients/'), ['Соль'])
+
+    def test_generatedata(self):
+        call_command(
+            'generatedata', users=2, recipes=2, tags=2,
+            ingredients_per_recipe=2, subscriptions=1, favorites=1, cart=1,
+            stdout=StringIO(),
+        )
+        self.assertEqual(len(self.names('/api/tags/')), 2)
+        self.assertTrue(self.names('/api/ingredients/'))
+
+    def test_etag_survives_bulk_data_in_the_default_cache(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        caches['default'].clear()
+        self.assertEqual(self.client.get('/api/tags/')['ETag'], etag)
@@ -0,0 +1,99 @@
+import base64
+import os
+import stat
+import struct
+import tracemalloc
+import zlib
+from io import BytesIO
+
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+from recipes.storage import ContentAddressedStorage
+from rest_framework.exceptions import ValidationError
+
+from api.fields import CHUNK_SIZE, Base64ImageField
+from api.tests.utils import IsolatedMixin
+
+
+def noise_png(width, height):
+    """PNG из шума: сжимается плохо, файл почти как несжатая картинка."""
+    buffer = BytesIO()
+    Image.frombytes(
+        'RGB', (width, height), os.urandom(width * height * 3)
+    ).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def resized_png(content, width, height):
+    """PNG content с другими размерами в заголовке."""
+    header = struct.pack('>II', width, height) + content[24:29]
+    return b''.join([
+        content[:16], header,
+        struct.pack('>I', zlib.crc32(b'IHDR' + header)), content[33:],
+    ])
+
+
+def data_url(content):
+    return 'data:image/png;base64,' + base64.b64encode(content).decode()
+
+
+class Base64ImageFieldTest(IsolatedMixin, SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.photo = noise_png(1000, 700)
+
+    def decode(self, data):
+        file = Base64ImageField().to_internal_value(data)
+        self.addCleanup(file.close)
+        return file
+
+    def assertRejected(self, data, code):
+        with self.assertRaises(ValidationError) as context:
+            self.decode(data)
+        self.assertEqual(context.exception.get_codes(), [code])
+
+    def test_decodes_into_a_temporary_file(self):
+        file = self.decode(data_url(self.photo))
+        self.assertEqual(file.size, len(self.photo))
+        with open(file.temporary_file_path(), 'rb') as saved:
+            self.assertEqual(saved.read(), self.photo)
+
+    def test_memory_does_not_hold_a_copy_of_the_file(self):
+        # Первый вызов загружает модули Pillow и Django.
+        self.decode(data_url(noise_png(10, 10)))
+        data = data_url(self.photo)
+        tracemalloc.start()
+        try:
+            self.decode(data)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, len(self.photo) // 4)
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=1024 * 1024)
+    def test_large_file_is_rejected_before_decoding(self):
+        # Испорченное начало строки не читается: отказ по ее длине раньше.
+        data = data_url(self.photo).replace(',', ',!', 1)
+        self.assertRejected(data, 'max_size')
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=1000 * 1000)
+    def test_large_image_is_rejected_by_the_first_chunk(self):
+        data = data_url(resized_png(self.photo, 4000, 3000))
+        start = data.index(',') + 1
+        self.assertGreater(len(data) - start, 2 * CHUNK_SIZE)
+        # Второй кусок испорчен: отказ приходит по заголовку из первого.
+        data = data[:start + CHUNK_SIZE] + '!' + data[start + CHUNK_SIZE:]
+        self.assertRejected(data, 'max_pixels')
+
+    def test_invalid_base64(self):
+        self.assertRejected(data_url(self.photo) + '!', 'invalid_base64')
+
+    def test_saved_file_is_readable_by_others(self):
+        storage = ContentAddressedStorage()
+        name = storage.save('recipes/photo.png', self.decode(
+            data_url(self.photo)
+        ))
+        mode = stat.S_IMODE(os.stat(storage.path(name)).st_mode)
+        self.assertEqual(mode, 0o644)
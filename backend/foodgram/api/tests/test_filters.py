@@ -0,0 +1,125 @@
+import re
+from itertools import product
+
+from django.core.exceptions import EmptyResultSet
+from django.test import TestCase
+from recipes.models import Recipe, ShoppingCart, Tag, User
+from rest_framework.test import (APIClient, APIRequestFactory,
+                                 force_authenticate)
+
+from api.tests.utils import IsolatedMixin
+from api.views import RecipeViewSet
+
+# Значения каждого параметра ленты; None - параметра нет.
+PARAMS = {
+    'tags': [None, 'lunch', ['lunch', 'dinner']],
+    'is_favorited': [None, '1'],
+    'is_in_shopping_cart': [None, '1'],
+    'author': [None, 'author'],
+    'search': [None, 'суп'],
+}
+FORBIDDEN = re.compile(r'\b(JOIN|DISTINCT)\b')
+
+
+class RecipeFilterTest(IsolatedMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='filter-user', email='filter-user@example.com'
+        )
+        cls.lunch = Tag.objects.create(name='Обед', slug='lunch', color='#000')
+        cls.dinner = Tag.objects.create(
+            name='Ужин', slug='dinner', color='#fff'
+        )
+        cls.recipes = {}
+        for tag in (cls.lunch, cls.dinner):
+            recipe = Recipe.objects.create(
+                author=cls.user,
+                name=f'Рецепт {tag.slug}',
+                text='Описание',
+                cooking_time=5,
+                image='recipes/test.png',
+            )
+            recipe.tags.set([tag])
+            cls.recipes[tag.slug] = recipe
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipes['lunch'])
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def ids(self, query):
+        response = self.client.get('/api/recipes/', query)
+        return {card['id'] for card in response.data['results']}
+
+    def test_without_tags_the_feed_is_empty(self):
+        self.assertEqual(self.ids({}), set())
+        self.assertEqual(self.ids({'is_favorited': '1'}), set())
+
+    def test_tags(self):
+        self.assertEqual(
+            self.ids({'tags': 'lunch'}), {self.recipes['lunch'].id}
+        )
+        self.assertEqual(
+            self.ids({'tags': ['lunch', 'dinner']}),
+            {recipe.id for recipe in self.recipes.values()},
+        )
+
+    def test_shopping_cart_ignores_tags(self):
+        expected = {self.recipes['lunch'].id}
+        self.assertEqual(self.ids({'is_in_shopping_cart': '1'}), expected)
+        self.assertEqual(
+            self.ids({'is_in_shopping_cart': '1', 'tags': 'dinner'}),
+            expected,
+        )
+
+    def test_search_with_cursor_is_paged_by_number(self):
+        expected = set()
+        for i in range(5):
+            recipe = Recipe.objects.create(
+                author=self.user,
+                name=f'Суп {i}',
+                text='Описание',
+                cooking_time=5,
+                image='recipes/test.png',
+            )
+            recipe.tags.set([self.lunch])
+            expected.add(recipe.id)
+        found = []
+        response = self.client.get('/api/recipes/', {
+            'tags': 'lunch', 'search': 'суп', 'cursor': '', 'limit': 2,
+        })
+        while True:
+            self.assertIn('count', response.data)
+            found += [card['id'] for card in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(sorted(found), sorted(expected))
+
+    def test_no_join_or_distinct_for_any_combination(self):
+        for values in product(*PARAMS.values()):
+            query = {
+                name: value for name, value in zip(PARAMS, values)
+                if value is not None
+            }
+            if 'author' in query:
+                query['author'] = self.user.id
+            with self.subTest(**query):
+                try:
+                    sql = str(self.queryset(query).query)
+                except EmptyResultSet:
+                    self.assertNotIn('tags', query)
+                    self.assertNotIn('is_in_shopping_cart', query)
+                    continue
+                self.assertIsNone(FORBIDDEN.search(sql), sql)
+
+    def queryset(self, query):
+        """Запрос ленты с параметрами query, как его строит RecipeViewSet."""
+        request = APIRequestFactory().get('/api/recipes/', query)
+        force_authenticate(request, user=self.user)
+        view = RecipeViewSet(action_map={'get': 'list'}, format_kwarg=None)
+        view.request = view.initialize_request(request)
+        return view.filter_queryset(view.get_queryset())
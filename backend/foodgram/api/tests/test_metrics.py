@@ -0,0 +1,36 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from api import metrics
+from api.tests.utils import IsolatedMixin
+
+KEY = ('recipe-list', 'GET', '200')
+
+
+class ProcessRegistrationTest(IsolatedMixin, SimpleTestCase):
+
+    def flush_as(self, process_key, count):
+        """Запись замеров от имени другого процесса."""
+        with mock.patch.multiple(
+            metrics, _process_key=process_key, _slot=None,
+            _histograms={}, _requests={KEY: count},
+        ):
+            metrics.flush()
+            return metrics._slot
+
+    def test_processes_take_separate_slots(self):
+        self.assertEqual(self.flush_as('metrics:process:a', 1), 1)
+        self.assertEqual(self.flush_as('metrics:process:b', 2), 2)
+        self.assertEqual(self.flush_as('metrics:process:a', 4), 1)
+        self.assertEqual(metrics.collect()[1], {KEY: 6})
+
+    def test_expired_slot_is_taken_again(self):
+        self.flush_as('metrics:process:a', 1)
+        self.flush_as('metrics:process:b', 2)
+        caches['state'].delete_many(
+            [metrics.slot_key(1), 'metrics:process:a']
+        )
+        self.assertEqual(self.flush_as('metrics:process:c', 4), 1)
+        self.assertEqual(metrics.collect()[1], {KEY: 6})
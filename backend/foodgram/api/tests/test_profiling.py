@@ -0,0 +1,24 @@
+from django.test import TestCase, override_settings
+from recipes.models import RequestProfile, User
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.tests.utils import IsolatedMixin
+
+
+class ProfilingTest(IsolatedMixin, TestCase):
+
+    @override_settings(PROFILE_SAMPLE_RATE=1.0)
+    def test_sql_parameters_are_not_stored(self):
+        user = User(username='profiled', email='profiled@example.com')
+        user.set_password('profiled-password')
+        user.save()
+        response = APIClient().post('/api/auth/token/login/', {
+            'email': 'profiled@example.com',
+            'password': 'profiled-password',
+        })
+        self.assertLess(response.status_code, 400, response.content)
+        record = RequestProfile.objects.get()
+        self.assertIn('authtoken_token', record.queries)
+        for secret in (Token.objects.get(user=user).key, user.password):
+            self.assertNotIn(secret, record.queries)
@@ -0,0 +1,249 @@
+"""
+Число SQL-запросов на маршрутах api/urls.py.
+
+Каждый маршрут вызывается на данных двух размеров: тест падает, если
+число запросов растет с числом строк или превышает бюджет маршрута, и
+перечисляет лишние запросы, чтобы было видно, какой N+1 добавлен.
+"""
+import re
+from collections import Counter
+
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredients,
+                            ShoppingCart, Subscription, Tag, User)
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api import recipe_cache
+from api.tests.utils import IMAGE, IsolatedMixin
+
+SMALL = 2
+LARGE = 6
+
+# Маршруты и допустимое число SQL-запросов на один вызов. Ключ объекта
+# в url берется из данных, созданных в seed().
+ROUTES = [
+    ('user-list', 'get', {}, 2),
+    ('user-detail', 'get', {'id': 'author'}, 1),
+    ('user-me', 'get', {}, 1),
+    ('user-subscriptions', 'get', {}, 3),
+    ('user-subscribe', 'post', {'id': 'new_author'}, 2),
+    ('user-subscribe', 'delete', {'id': 'new_author'}, 1),
+    ('user-set-password', 'post', {}, 2),
+    ('user-list', 'post', {}, 6),
+    ('tag-list', 'get', {}, 1),
+    ('tag-detail', 'get', {'pk': 'tag'}, 1),
+    ('ingredient-list', 'get', {}, 0),
+    ('ingredient-detail', 'get', {'pk': 'ingredient'}, 1),
+    ('recipe-list', 'get', {}, 6),
+    ('recipe-detail', 'get', {'id': 'recipe'}, 5),
+    ('recipe-favorite', 'post', {'id': 'new_recipe'}, 2),
+    ('recipe-favorite', 'delete', {'id': 'new_recipe'}, 1),
+    ('recipe-shopping-cart', 'post', {'id': 'new_recipe'}, 6),
+    ('recipe-shopping-cart', 'delete', {'id': 'new_recipe'}, 5),
+    ('recipe-download-shopping-cart', 'get', {}, 1),
+    ('recipe-list', 'post', {}, 9),
+    ('recipe-detail', 'patch', {'id': 'recipe'}, 18),
+    ('recipe-detail', 'delete', {'id': 'recipe'}, 12),
+]
+
+# Замеры идут внутри откатываемой транзакции, поэтому внешние atomic()
+# маршрутов становятся точками сохранения. В работе их нет, они не
+# считаются.
+SAVEPOINT = re.compile(r'(RELEASE |ROLLBACK TO )?SAVEPOINT ')
+
+NORMALIZE = [
+    (re.compile(r"'[^']*'|\b\d+\b"), '?'),
+    (re.compile(r'\(\?(, \?)*\)'), '(...)'),
+    (re.compile(r'( UNION ALL SELECT \?(, \?)*)+'), ' UNION ALL ...'),
+]
+
+
+def normalize(sql):
+    """Запрос без литералов: одинаковые запросы к разным строкам совпадают."""
+    for pattern, replacement in NORMALIZE:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+class Rollback(Exception):
+    """Откат данных одного размера после замеров."""
+
+
+class QueryBudgetTest(IsolatedMixin, TestCase):
+
+    def test_routes(self):
+        small = self.measure(SMALL)
+        large = self.measure(LARGE)
+        for route, small_queries, large_queries in zip(ROUTES, small, large):
+            name, method, _, budget = route
+            with self.subTest(route=name, method=method):
+                problems = []
+                if len(large_queries) > len(small_queries):
+                    problems.append(
+                        f'растет с числом строк: {len(small_queries)} -> '
+                        f'{len(large_queries)}'
+                    )
+                if len(large_queries) > budget:
+                    problems.append(
+                        f'превышен бюджет: {len(large_queries)} > {budget}'
+                    )
+                if problems:
+                    self.fail(self.report(
+                        problems, budget, small_queries, large_queries
+                    ))
+
+    def report(self, problems, budget, small_queries, large_queries):
+        """Проблемы маршрута и запросы, которые их дали."""
+        lines = list(problems)
+        extra = (
+            Counter(map(normalize, large_queries))
+            - Counter(map(normalize, small_queries))
+        )
+        for sql, count in extra.items():
+            lines.append(f'  +{count} {sql}')
+        for sql in large_queries[budget:]:
+            if normalize(sql) not in extra:
+                lines.append(f'  сверх бюджета: {sql}')
+        return '\n'.join(lines)
+
+    def measure(self, size):
+        """Список запросов каждого маршрута на данных размера size."""
+        results = []
+        try:
+            with transaction.atomic():
+                objects = self.seed(size)
+                for name, method, kwargs, _ in ROUTES:
+                    results.append(self.call(
+                        objects, size, name, method, kwargs
+                    ))
+                raise Rollback
+        except Rollback:
+            pass
+        return results
+
+    def call(self, objects, size, name, method, kwargs):
+        path = reverse(name, kwargs={
+            key: objects[value].pk for key, value in kwargs.items()
+        })
+        data = self.payload(objects, name, method)
+        query = {'limit': size, 'recipes_limit': size}
+        if name == 'recipe-list' and method == 'get':
+            query['tags'] = objects['tag'].slug
+        request = getattr(APIRequestFactory(), method)(
+            path, data if method != 'get' else query, format='json',
+        )
+        force_authenticate(request, user=objects['user'])
+        match = resolve(path)
+        with CaptureQueriesContext(connection) as context:
+            response = match.func(request, *match.args, **match.kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(
+            response.status_code, 400,
+            f'{method.upper()} {path}: {getattr(response, "data", "")}'
+        )
+        return [
+            captured['sql'] for captured in context.captured_queries
+            if not SAVEPOINT.match(captured['sql'])
+        ]
+
+    def payload(self, objects, name, method):
+        if name == 'user-list':
+            return {
+                'email': 'budget-new@example.com',
+                'username': 'budget-new',
+                'first_name': 'Бюджет',
+                'last_name': 'Запросов',
+                'password': 'budget-password',
+            }
+        if name == 'user-set-password':
+            return {
+                'current_password': 'budget-password',
+                'new_password': 'budget-password-2',
+            }
+        if name in ('recipe-list', 'recipe-detail') and method != 'delete':
+            return {
+                'name': 'Новый рецепт',
+                'text': 'Описание',
+                'cooking_time': 10,
+                'image': IMAGE,
+                'tags': [tag.id for tag in objects['tags']],
+                'ingredients': [
+                    {'id': ingredient.id, 'amount': 5}
+                    for ingredient in objects['ingredients']
+                ],
+            }
+        return None
+
+    def seed(self, size):
+        """Данные, в которых каждая связь содержит size строк."""
+        user = User(
+            username='budget-user', email='budget-user@example.com'
+        )
+        user.set_password('budget-password')
+        user.save()
+        authors = [
+            User.objects.create(
+                username=f'budget-author-{i}',
+                email=f'budget-author-{i}@example.com',
+            )
+            for i in range(size)
+        ]
+        new_author = User.objects.create(
+            username='budget-new-author',
+            email='budget-new-author@example.com',
+        )
+        tags = [
+            Tag.objects.create(
+                name=f'budget-{i}', slug=f'budget-{i}', color='#000000'
+            )
+            for i in range(size)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'budget-{i}', measurement_unit='г'
+            )
+            for i in range(size)
+        ]
+        recipes = []
+        for author in authors:
+            Subscription.objects.create(user=user, author=author)
+            for i in range(size):
+                recipe = Recipe.objects.create(
+                    author=author,
+                    name=f'budget-{i}',
+                    text='budget',
+                    cooking_time=5,
+                    image='recipes/budget.png',
+                )
+                recipe.tags.set(tags)
+                RecipeIngredients.objects.bulk_create([
+                    RecipeIngredients(
+                        recipe=recipe, ingredient=ingredient, amount=i + 1
+                    )
+                    for ingredient in ingredients
+                ])
+                recipes.append(recipe)
+        for recipe in recipes[:size]:
+            Favorite.objects.create(user=user, recipe=recipe)
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+        # SQLite после отката снова выдает те же id: новые версии не
+        # дают им найти карточки прошлого размера.
+        for recipe in recipes:
+            recipe_cache.bump('recipe', recipe.id)
+        return {
+            'user': user,
+            'author': authors[0],
+            'new_author': new_author,
+            'tag': tags[0],
+            'tags': tags,
+            'ingredient': ingredients[0],
+            'ingredients': ingredients,
+            'recipe': recipes[0],
+            'new_recipe': recipes[-1],
+        }
@@ -0,0 +1,105 @@
+from django.core.cache import caches
+from django.test import TestCase
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredients,
+                            ShoppingCart, Subscription, Tag, User)
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api import recipe_cache
+from api.tests.utils import IsolatedMixin
+
+# Счет, страница и карточки страницы: рецепты, авторы, теги, инградиенты.
+LIST_QUERIES = 6
+# Рецепт и его карточка.
+DETAIL_QUERIES = 5
+
+
+class RecipeQueriesTest(IsolatedMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='reader', email='reader@example.com'
+        )
+        cls.tag = Tag.objects.create(name='Обед', slug='lunch', color='#000')
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Инградиент {i}', measurement_unit='г'
+            )
+            for i in range(3)
+        ]
+        for number in range(4):
+            author = User.objects.create(
+                username=f'author-{number}',
+                email=f'author-{number}@example.com',
+            )
+            Subscription.objects.create(user=cls.user, author=author)
+            for i in range(3):
+                recipe = Recipe.objects.create(
+                    author=author,
+                    name=f'Рецепт {number}-{i}',
+                    text='Описание',
+                    cooking_time=5,
+                    image='recipes/test.png',
+                )
+                recipe.tags.set([cls.tag])
+                RecipeIngredients.objects.bulk_create(
+                    RecipeIngredients(
+                        recipe=recipe, ingredient=ingredient, amount=i + 1
+                    )
+                    for ingredient in ingredients
+                )
+        cls.favorites = set(
+            Recipe.objects.order_by('id').values_list('id', flat=True)[::2]
+        )
+        for recipe_id in cls.favorites:
+            Favorite.objects.create(user=cls.user, recipe_id=recipe_id)
+            ShoppingCart.objects.create(user=cls.user, recipe_id=recipe_id)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        for limit in (2, 10):
+            caches['cards'].clear()
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(LIST_QUERIES):
+                    response = self.client.get(
+                        '/api/recipes/', {'limit': limit, 'tags': 'lunch'}
+                    )
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_detail_queries(self):
+        for recipe in Recipe.objects.order_by('id')[:2]:
+            caches['cards'].clear()
+            with self.subTest(recipe=recipe.id):
+                with self.assertNumQueries(DETAIL_QUERIES):
+                    response = self.client.get(f'/api/recipes/{recipe.id}/')
+                self.assertEqual(response.data['id'], recipe.id)
+
+    def test_cached_cards_need_only_the_page(self):
+        self.client.get('/api/recipes/', {'limit': 10, 'tags': 'lunch'})
+        with self.assertNumQueries(2):
+            self.client.get('/api/recipes/', {'limit': 10, 'tags': 'lunch'})
+
+    def test_flags_of_the_whole_page(self):
+        response = self.client.get(
+            '/api/recipes/', {'limit': 12, 'tags': 'lunch'}
+        )
+        for card in response.data['results']:
+            expected = card['id'] in self.favorites
+            self.assertEqual(card['is_favorited'], expected)
+            self.assertEqual(card['is_in_shopping_cart'], expected)
+            self.assertTrue(card['author']['is_subscribed'])
+
+    def test_recipe_deleted_after_the_page_query(self):
+        recipes = list(Recipe.objects.order_by('id')[:3])
+        recipes[1].delete()
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = self.user
+        data = recipe_cache.cards(recipes, {'request': request})
+        self.assertEqual(
+            [card['id'] for card in data], [recipes[0].id, recipes[2].id]
+        )
@@ -0,0 +1,108 @@
+"""
+Чтение с реплики: вторая база - зеркало тестовой, поэтому видны те же
+данные, а куда ушли запросы, видно по подключению.
+"""
+from contextlib import ExitStack
+
+from django.core.cache import cache
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from recipes.models import Recipe, Tag, User
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import replicas
+from api.tests.utils import IsolatedMixin
+
+REPLICA = 'replica1'
+
+
+@override_settings(
+    DATABASE_ROUTERS=['api.replicas.ReplicaRouter'],
+    DATABASE_REPLICAS=[REPLICA],
+)
+class ReplicaRoutingTest(IsolatedMixin, TransactionTestCase):
+    databases = {'default', REPLICA}
+
+    @classmethod
+    def setUpClass(cls):
+        connections.databases[REPLICA] = {
+            **connections['default'].settings_dict,
+            'TEST': {'MIRROR': 'default'},
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections.databases[REPLICA]
+
+    def setUp(self):
+        super().setUp()
+        author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        self.recipe = Recipe.objects.create(
+            author=author,
+            name='Рецепт',
+            text='Описание',
+            cooking_time=5,
+            image='recipes/test.png',
+        )
+        self.recipe.tags.set([
+            Tag.objects.create(name='Обед', slug='lunch', color='#000')
+        ])
+        user = User.objects.create(
+            username='reader', email='reader@example.com'
+        )
+        self.authorization = f'Token {Token.objects.create(user=user).key}'
+        self.anonymous = APIClient()
+        self.client = APIClient(HTTP_AUTHORIZATION=self.authorization)
+        self.recipes = f'{reverse("recipe-list")}?tags=lunch'
+        self.favorites = f'{self.recipes}&is_favorited=1'
+        # Карточки попадают в кэш с основной базы, замеры - после них.
+        self.anonymous.get(self.recipes)
+
+    def test_reads_go_to_the_replica(self):
+        self.assertRouted(self.anonymous.get, self.recipes, REPLICA)
+        self.assertRouted(self.client.get, self.recipes, REPLICA)
+
+    def test_client_is_pinned_to_the_primary_after_a_write(self):
+        favorite = reverse('recipe-favorite', kwargs={'id': self.recipe.pk})
+        self.assertRouted(self.client.post, favorite, 'default')
+        response = self.assertRouted(
+            self.client.get, self.favorites, 'default'
+        )
+        self.assertEqual(
+            [card['id'] for card in response.data['results']],
+            [self.recipe.id],
+        )
+        # Закреплен только клиент, который писал.
+        self.assertRouted(self.anonymous.get, self.recipes, REPLICA)
+        cache.delete(replicas.pin_key(self.authorization))
+        self.assertRouted(self.client.get, self.favorites, REPLICA)
+
+    def assertRouted(self, call, path, expected):
+        """Запросы к рецептам вызова ушли только в базу expected."""
+        with ExitStack() as stack:
+            contexts = {
+                alias: stack.enter_context(
+                    CaptureQueriesContext(connections[alias])
+                )
+                for alias in ('default', REPLICA)
+            }
+            response = call(path)
+        self.assertLess(response.status_code, 400)
+        # Токены и запись всегда идут в основную базу.
+        used = {
+            alias for alias, context in contexts.items()
+            if any(
+                'recipes_' in query['sql'] and 'authtoken_' not in query['sql']
+                for query in context.captured_queries
+            )
+        }
+        self.assertEqual(used, {expected}, path)
+        return response
@@ -0,0 +1,154 @@
+"""
+Одновременные одинаковые запросы на добавление и удаление избранного,
+корзины и подписки: успешен ровно один, повторов в базе и расхождений
+в списке покупок нет, а успешный запрос укладывается в бюджет запросов.
+Одновременное добавление в корзину разных рецептов с общими
+инградиентами успешно и не дает расхождений.
+"""
+import threading
+
+from django.db import connection
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredients,
+                            ShoppingCart, ShoppingListItem, Subscription,
+                            User)
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.management.commands.shoppinglists import \
+    Command as ShoppingListsCommand
+from api.tests.utils import IsolatedMixin
+
+THREADS = 8
+ROUNDS = 3
+
+
+class ConcurrentToggleTest(IsolatedMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Потокам нужна база в файле или PostgreSQL.')
+        self.user = User.objects.create(
+            username='toggler', email='toggler@example.com'
+        )
+        self.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        self.ingredients = [
+            Ingredient.objects.create(
+                name=f'Инградиент {i}', measurement_unit='г'
+            )
+            for i in range(3)
+        ]
+        self.recipe = self.create_recipe('Рецепт')
+
+    def create_recipe(self, name):
+        recipe = Recipe.objects.create(
+            author=self.author,
+            name=name,
+            text='Описание',
+            cooking_time=5,
+            image='recipes/test.png',
+        )
+        for i, ingredient in enumerate(self.ingredients):
+            RecipeIngredients.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=i + 1
+            )
+        return recipe
+
+    def test_favorite(self):
+        self.toggle(
+            'recipe-favorite', self.recipe,
+            Favorite.objects.filter(user=self.user, recipe=self.recipe),
+            budgets={'post': 2, 'delete': 1},
+        )
+
+    def test_shopping_cart(self):
+        self.toggle(
+            'recipe-shopping-cart', self.recipe,
+            ShoppingCart.objects.filter(user=self.user, recipe=self.recipe),
+            budgets={'post': 6, 'delete': 5},
+        )
+        self.assertFalse(ShoppingListItem.objects.filter(user=self.user))
+
+    def test_shopping_cart_recipes_with_common_ingredients(self):
+        # Строк списка покупок еще нет: оба запроса создают одни и те же.
+        paths = [
+            reverse('recipe-shopping-cart', kwargs={'id': recipe.pk})
+            for recipe in (self.recipe, self.create_recipe('Второй рецепт'))
+        ]
+        for _ in range(ROUNDS):
+            for method, expected in (('post', 200), ('delete', 204)):
+                results = self.concurrently(method, paths)
+                self.assertEqual(
+                    [status for status, _ in results], [expected] * 2, method
+                )
+                self.assertEqual(
+                    ShoppingListsCommand().differences([self.user.id]), {}
+                )
+
+    def test_subscribe(self):
+        self.toggle(
+            'user-subscribe', self.author,
+            Subscription.objects.filter(user=self.user, author=self.author),
+            budgets={'post': 2, 'delete': 1},
+        )
+
+    def toggle(self, name, target, rows, budgets):
+        for _ in range(ROUNDS):
+            for method, expected in (('post', 200), ('delete', 204)):
+                results = self.concurrently(method, [
+                    reverse(name, kwargs={'id': target.pk})
+                ] * THREADS)
+                statuses = sorted(status for status, _ in results)
+                self.assertEqual(
+                    statuses, [expected] + [400] * (THREADS - 1), method
+                )
+                self.assertEqual(rows.count(), int(method == 'post'))
+                for status, queries in results:
+                    if status == expected:
+                        self.assertLessEqual(queries, budgets[method])
+                self.assertEqual(
+                    ShoppingListsCommand().differences([self.user.id]), {}
+                )
+
+    def concurrently(self, method, paths):
+        """
+        Пары (статус, число запросов) одновременных вызовов путей paths.
+
+        BEGIN, который SQLite пишет в начале atomic(), не считается: в
+        PostgreSQL такого запроса нет.
+        """
+        barrier = threading.Barrier(len(paths))
+        results = []
+
+        def call(path):
+            match = resolve(path)
+            request = getattr(APIRequestFactory(), method)(path)
+            force_authenticate(request, user=self.user)
+            try:
+                barrier.wait()
+                with CaptureQueriesContext(connection) as context:
+                    response = match.func(
+                        request, *match.args, **match.kwargs
+                    )
+                results.append(
+                    (response.status_code, len([
+                        captured for captured in context.captured_queries
+                        if captured['sql'] != 'BEGIN'
+                    ]))
+                )
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=call, args=(path,)) for path in paths
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), len(paths))
+        return results
@@ -0,0 +1,66 @@
+"""
+Общее для тестов API.
+
+Кэши в тестах - в памяти процесса, а медиа и индекс инградиентов - во
+временном каталоге класса: общие кэш и файлы сервера тесты не трогают,
+а id, повторно выданные базой, не находят чужих карточек в кэше.
+"""
+import os
+import shutil
+import tempfile
+
+from django.core.cache import caches
+from django.test.utils import override_settings
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests',
+    },
+    'cards': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-cards',
+    },
+    'state': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-state',
+    },
+    'tokens': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-tokens',
+    },
+}
+
+# Картинка 1x1 в base64 для запросов на создание и изменение рецепта.
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mP8z8DwHwAFBQIAX8jx0gAAAABJRU5ErkJggg=='
+)
+
+
+class IsolatedMixin:
+    """Свои кэши, медиа и индекс инградиентов у класса тестов."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.isolated_settings = override_settings(
+            CACHES=CACHES,
+            MEDIA_ROOT=cls.directory,
+            INGREDIENT_INDEX_PATH=os.path.join(
+                cls.directory, 'ingredients.idx'
+            ),
+        )
+        cls.isolated_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.isolated_settings.disable()
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def setUp(self):
+        super().setUp()
+        for alias in CACHES:
+            caches[alias].clear()
@@ -1,5 +1,5 @@
 from api.views import (AuthTokenLogoutView, AuthTokenView, IngredientViewSet,
-                       RecipeViewSet, TagViewSet, UserViewSet)
+                       MetricsView, RecipeViewSet, TagViewSet, UserViewSet)
 from django.urls import include, path
 from rest_framework import routers
 
@@ -12,5 +12,6 @@ router.register('recipes', RecipeViewSet, basename='recipe')
 urlpatterns = [
     path('auth/token/login/', AuthTokenView.as_view()),
     path('auth/token/logout/', AuthTokenLogoutView.as_view()),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('', include(router.urls)),
 ]
@@ -1,6 +1,8 @@
-from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Count, Sum
-from django.http import HttpResponse
+from django.db import IntegrityError, transaction
+from django.db.models import (BooleanField, Count, Exists, OuterRef, Prefetch,
+                              Subquery, Value, prefetch_related_objects)
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import TokenCreateView, TokenDestroyView
@@ -10,25 +12,41 @@ from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
 
+from api import (catalog, ingredient_index, metrics, recipe_cache,
+                 shopping_list)
 from api.filters import RecipeFilter
-from api.permissions import IsAuthenticatedForDetail, IsAuthenticatedOrReadOnly
+from api.permissions import (IsAdmin, IsAuthenticatedForDetail,
+                             IsAuthenticatedOrReadOnly)
+from api.renderers import (ShoppingListCSVRenderer, ShoppingListPDFRenderer,
+                           ShoppingListTXTRenderer)
 from api.serializers import (FavoriteShoppingCartSerializer,
                              IngredientGetSerializer, PasswordSerializer,
                              RecipeGetSerializer, RecipeWriteSerializer,
                              SubscribeSerializer, TagSerializer,
                              UserSerializer)
 
-from csv import writer
-
 
 class UserViewSet(viewsets.ModelViewSet):
     """ViewSet для доступа к пользователям."""
+    read_from_replica = True
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticatedForDetail]
     lookup_field = 'id'
+    cursor_ordering = ('username',)
+
+    def get_queryset(self):
+        """Пользователи с отметкой подписки, без запроса на каждого."""
+        queryset = User.objects.all()
+        user = self.request.user
+        if user.is_authenticated:
+            queryset = queryset.annotate(is_subscribed=Exists(
+                Subscription.objects.filter(user=user, author=OuterRef('pk'))
+            ))
+        return queryset
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -57,21 +75,10 @@ class UserViewSet(viewsets.ModelViewSet):
         permission_classes=[permissions.IsAuthenticated],
     )
     def me(self, request):
-        user = get_object_or_404(User, username=request.user)
-        serializer = self.get_serializer(
-            user, data=request.data, partial=True
-        )
-        if serializer.is_valid():
-            if not user.is_admin and 'role' in serializer.validated_data:
-                serializer.validated_data.pop('role')
-            serializer.save(**serializer.validated_data)
-            return Response(
-                serializer.data,
-                status=status.HTTP_200_OK
-            )
+        serializer = self.get_serializer(request.user)
         return Response(
-            serializer.errors,
-            status=status.HTTP_400_BAD_REQUEST
+            serializer.data,
+            status=status.HTTP_200_OK
         )
 
     @action(
@@ -80,7 +87,7 @@ class UserViewSet(viewsets.ModelViewSet):
         permission_classes=[permissions.IsAuthenticated],
     )
     def set_password(self, request):
-        user = get_object_or_404(User, username=request.user)
+        user = request.user
         serializer = PasswordSerializer(
             user, data=request.data, partial=True
         )
@@ -103,16 +110,23 @@ class UserViewSet(viewsets.ModelViewSet):
         permission_classes=[permissions.IsAuthenticated],
     )
     def subscribe(self, request, id):
-        """Реализует добавление/удаление в список подписчиков"""
-        user = get_object_or_404(User, username=request.user)
-        author = get_object_or_404(User, id=id)
+        """
+        Реализует добавление/удаление в список подписчиков.
+        Повторы отсекает уникальный индекс: подписка добавляется и
+        удаляется одним запросом без предварительной проверки.
+        """
+        user = request.user
         if self.request.method == 'POST':
-            if Subscription.objects.filter(user=user, author=author).exists():
+            author = get_object_or_404(User, id=id)
+            try:
+                with transaction.atomic():
+                    Subscription.objects.create(user=user, author=author)
+            except IntegrityError:
                 return Response(
                     "Подписка уже существует",
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            Subscription.objects.create(user=user, author=author)
+            author.is_subscribed = True
             serializer = UserSerializer(
                 author,
                 context={'request': request})
@@ -120,16 +134,15 @@ class UserViewSet(viewsets.ModelViewSet):
                 serializer.data,
                 status=status.HTTP_200_OK
             )
-        try:
-            author = Subscription.objects.get(
-                user=user, author=author,
-            )
-        except ObjectDoesNotExist:
+        deleted, _ = Subscription.objects.filter(
+            user=user, author_id=id,
+        ).delete()
+        if not deleted:
+            get_object_or_404(User, id=id)
             return Response(
                 "Подписка не существует.",
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        author.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -138,8 +151,13 @@ class UserViewSet(viewsets.ModelViewSet):
         permission_classes=[permissions.IsAuthenticated],
     )
     def subscriptions(self, request):
-        """Возвращает список подписки"""
-        user = get_object_or_404(User, username=request.user)
+        """
+        Возвращает список подписки.
+        Страница загружается фиксированным числом запросов: число
+        рецептов считается в запросе авторов, первые recipes_limit
+        рецептов всех авторов страницы выбираются одним запросом.
+        """
+        user = request.user
 
         queryset = (
             User.objects.filter(
@@ -147,10 +165,15 @@ class UserViewSet(viewsets.ModelViewSet):
                 .objects.filter(user=user)
                 .values_list('author', flat=True)
             )
+            .annotate(
+                recipes_count=Count('recipe_author'),
+                is_subscribed=Value(True, output_field=BooleanField()),
+            )
         )
 
         page = self.paginate_queryset(queryset)
         if page is not None:
+            self.prefetch_preview_recipes(page)
             serializer = SubscribeSerializer(
                 page,
                 many=True,
@@ -162,6 +185,29 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    def prefetch_preview_recipes(self, authors):
+        """
+        Первые recipes_limit рецептов каждого автора в preview_recipes.
+        Django 2.2 не фильтрует по оконным функциям, поэтому рецепты
+        отбираются коррелированным подзапросом с LIMIT, который идет по
+        индексу (автор, дата создания).
+        """
+        recipes = Recipe.objects.only(
+            'id', 'author_id', 'name', 'image', 'processed_image',
+            'cooking_time'
+        )
+        limit = self.request.query_params.get('recipes_limit')
+        if limit is not None:
+            recipes = recipes.filter(id__in=Subquery(
+                Recipe.objects
+                .filter(author=OuterRef('author'))
+                .order_by('-created_at', '-id')
+                .values('id')[:int(limit)]
+            ))
+        prefetch_related_objects(authors, Prefetch(
+            'recipe_author', queryset=recipes, to_attr='preview_recipes'
+        ))
+
 
 class AuthTokenView(TokenCreateView):
     """View класс для получения токена."""
@@ -173,6 +219,17 @@ class AuthTokenLogoutView(TokenDestroyView):
     permission_classes = [permissions.IsAuthenticated]
 
 
+class MetricsView(APIView):
+    """Замеры запросов всех процессов в формате Prometheus."""
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        return HttpResponse(
+            metrics.exposition(),
+            content_type='text/plain; version=0.0.4; charset=utf-8',
+        )
+
+
 class ListRetrieveViewSet(
     ListModelMixin,
     RetrieveModelMixin,
@@ -183,41 +240,105 @@ class ListRetrieveViewSet(
 
 class TagViewSet(ListRetrieveViewSet):
     """ViewSet для доступа к тегам."""
+    read_from_replica = True
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [permissions.AllowAny]
     pagination_class = None
 
+    @catalog.conditional(catalog.TAGS)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @catalog.conditional(catalog.TAGS)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class IngredientViewSet(ListRetrieveViewSet):
     """ViewSet для доступа к инградиентам."""
+    read_from_replica = True
     queryset = Ingredient.objects.all()
     serializer_class = IngredientGetSerializer
     permission_classes = [permissions.AllowAny]
     pagination_class = None
 
+    @catalog.conditional(catalog.INGREDIENTS)
     def list(self, request, *args, **kwargs):
-        """Возвращает список рецептов с фильтрацией по параметрам"""
-        name = request.query_params.get('name')
-        if name is not None:
-            queryset = self.filter_queryset(self.get_queryset()).filter(
-                name__istartswith=name,
-            )
-        else:
-            queryset = self.filter_queryset(self.get_queryset())
+        """
+        Возвращает инградиенты, название которых начинается с name.
+        С mode=fuzzy поиск ранжированный и допускает опечатки.
+        Поиск выполняется по общему индексу, без запросов к базе.
+        """
+        name = request.query_params.get('name', '')
+        if request.query_params.get('mode') == 'fuzzy':
+            return Response(ingredient_index.ranked_search(name))
+        return Response(ingredient_index.search(name))
 
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+    @catalog.conditional(catalog.INGREDIENTS)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """ViewSet для рецептов."""
+    read_from_replica = True
     queryset = Recipe.objects.all()
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
     permission_classes = [IsAuthenticatedOrReadOnly]
     lookup_field = 'id'
 
+    @property
+    def cursor_ordering(self):
+        """
+        Порядок ленты для курсора. Курсор строится по первому полю
+        порядка, а ранг поиска у многих рецептов одинаков: найденные
+        рецепты всегда отдаются страницами page.
+        """
+        if self.request.query_params.get('search', '').strip():
+            return None
+        return ('-created_at', '-id')
+
+    def get_queryset(self):
+        """
+        Рецепты для чтения аннотируются отметками пользователя: остальное
+        берется из кэша карточек, см. api.recipe_cache. Поисковый вектор
+        нужен только в условиях запроса и не загружается.
+        """
+        queryset = Recipe.objects.defer('search_vector')
+        user = self.request.user
+        if (
+            self.action not in ('list', 'retrieve')
+            or not user.is_authenticated
+        ):
+            return queryset
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            author_is_subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('author')
+            )),
+        )
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        data = recipe_cache.cards(page, self.get_serializer_context())
+        return self.get_paginated_response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        data = recipe_cache.cards(
+            [self.get_object()], self.get_serializer_context()
+        )
+        if not data:
+            raise Http404
+        return Response(data[0])
+
     def get_serializer_class(self):
         """Выбор сериализатора в зависимости от метода"""
         if (
@@ -239,31 +360,41 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[permissions.IsAuthenticated],
     )
     def shopping_cart(self, request, id):
-        """Реализует добавление/удаление в список покупок"""
-        user = get_object_or_404(User, username=request.user)
-        recipe = get_object_or_404(Recipe, id=id)
+        """
+        Реализует добавление/удаление в список покупок.
+        Суммы списка покупок меняются, только если изменилась корзина.
+        """
+        user = request.user
         if self.request.method == 'POST':
-            if ShoppingCart.objects.filter(user=user, recipe=recipe).exists():
-                return Response(
-                    "Рецепт уже добавлен в корзину.",
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            ShoppingCart.objects.create(user=user, recipe=recipe)
+            recipe = get_object_or_404(Recipe, id=id)
+            with transaction.atomic():
+                try:
+                    ShoppingCart.objects.create(user=user, recipe=recipe)
+                except IntegrityError:
+                    # Транзакция с ошибкой только откатывается.
+                    transaction.set_rollback(True)
+                    return Response(
+                        "Рецепт уже добавлен в корзину.",
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+                shopping_list.change_cart(user, recipe, 1)
             serializer = FavoriteShoppingCartSerializer(recipe)
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
             )
-        try:
-            recipe_in_cart = ShoppingCart.objects.get(
-                user=user, recipe=recipe,
-            )
-        except ObjectDoesNotExist:
+        with transaction.atomic():
+            deleted, _ = ShoppingCart.objects.filter(
+                user=user, recipe_id=id,
+            ).delete()
+            if deleted:
+                shopping_list.change_cart(user, Recipe(id=id), -1)
+        if not deleted:
+            get_object_or_404(Recipe, id=id)
             return Response(
                 "Рецепта нет в корзине.",
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        recipe_in_cart.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -273,59 +404,65 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def favorite(self, request, id):
         """Реализует добавление/удаление в избранное"""
-        user = get_object_or_404(User, username=request.user)
-        recipe = get_object_or_404(Recipe, id=id)
+        user = request.user
         if self.request.method == 'POST':
-            if Favorite.objects.filter(user=user, recipe=recipe).exists():
+            recipe = get_object_or_404(Recipe, id=id)
+            try:
+                with transaction.atomic():
+                    Favorite.objects.create(user=user, recipe=recipe)
+            except IntegrityError:
                 return Response(
                     "Рецепт уже добавлен в избранное.",
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            Favorite.objects.create(user=user, recipe=recipe)
             serializer = FavoriteShoppingCartSerializer(recipe)
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
             )
-        try:
-            favorite = Favorite.objects.get(
-                user=user, recipe=recipe,
-            )
-        except ObjectDoesNotExist:
+        deleted, _ = Favorite.objects.filter(
+            user=user, recipe_id=id,
+        ).delete()
+        if not deleted:
+            get_object_or_404(Recipe, id=id)
             return Response(
                 "Рецепта нет в избранном.",
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        favorite.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         detail=False,
         methods=['get'],
         permission_classes=[permissions.IsAuthenticated],
+        renderer_classes=[
+            ShoppingListCSVRenderer,
+            ShoppingListTXTRenderer,
+            ShoppingListPDFRenderer,
+        ],
     )
     def download_shopping_cart(self, request):
-        """Реализует получение списка инградиентов из рецептов"""
-        user = get_object_or_404(User, username=request.user)
-        result = (ShoppingCart.objects
-                  .filter(user=user).select_related('recipe')
-                  .values(
-                      'recipe__ingredients__ingredient__name',
-                      'recipe__ingredients__ingredient__measurement_unit'
-                  ).annotate(
-                      names=Count('recipe__ingredients__ingredient__name'),
-                      amount=Sum('recipe__ingredients__amount')
-                  ).order_by())
-        response = HttpResponse(
-            content_type='text/csv',
+        """
+        Реализует получение списка инградиентов из рецептов.
+        Формат файла задается параметром format: csv, txt или pdf.
+        """
+        user = request.user
+        renderer = request.accepted_renderer
+        filename = f'ingredients.{renderer.format}'
+        if renderer.format == 'pdf':
+            return FileResponse(
+                shopping_list.pdf_file(user),
+                as_attachment=True,
+                filename=filename,
+                content_type=renderer.media_type,
+            )
+        rows = (
+            shopping_list.txt_rows(user) if renderer.format == 'txt'
+            else shopping_list.csv_rows(user)
+        )
+        response = StreamingHttpResponse(
+            rows,
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
         )
-        response['Content-Disposition'] = (
-            'attachment; filename=ingredients.csv')
-        csv_writer = writer(response)
-        for line in result:
-            csv_writer.writerow([
-                line['recipe__ingredients__ingredient__name'],
-                line['recipe__ingredients__ingredient__measurement_unit'],
-                line['amount'],
-            ])
+        response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -27,15 +28,18 @@ INSTALLED_APPS = [
     'djoser',
     'django_filters',
     'recipes',
-    'api',
+    'api.apps.ApiConfig',
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.profiling.ProfilingMiddleware',
+    'api.replicas.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -62,11 +66,16 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'api.paginators.FoodgramPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
@@ -91,6 +100,22 @@ DATABASES = {
     }
 }
 
+# Реплики основной базы через запятую: безопасные запросы к рецептам,
+# тегам, инградиентам и пользователям читают с них. После записи клиент
+# REPLICA_PIN_SECONDS секунд читает с основной базы.
+DATABASE_REPLICAS = []
+for number, host in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), 1
+):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 10))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -125,3 +150,99 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Большие загрузки переносятся из временного файла с правами 0600, а
+# nginx читает медиа под своим пользователем.
+FILE_UPLOAD_PERMISSIONS = 0o644
+FILE_UPLOAD_DIRECTORY_PERMISSIONS = 0o755
+
+# Наибольший размер изображения рецепта в байтах и в точках. Тело JSON
+# может быть больше изображения в base64 не больше чем на мегабайт.
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', 10 * 1024 * 1024)
+)
+RECIPE_IMAGE_MAX_PIXELS = int(
+    os.getenv('RECIPE_IMAGE_MAX_PIXELS', 40 * 1000 * 1000)
+)
+JSON_MAX_BODY_SIZE = RECIPE_IMAGE_MAX_SIZE * 4 // 3 + 1024 * 1024
+
+# Шрифт с кириллицей для выгрузки списка покупок в PDF.
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+# Кэши, общие для всех воркеров на сервере. В default ответы
+# справочников и закрепления за основной базой, в cards карточки
+# рецептов: FileBasedCache удаляет треть записей, когда их больше
+# MAX_ENTRIES, поэтому размер cards - не меньше числа рецептов. В state
+# версии рецептов и справочников, счетчики и замеры: он не вытесняет
+# записи, см. api.cache_backends.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram-cache')
+        ),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CACHE_SIZE', 10000))},
+    },
+    'cards': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv(
+            'CARD_CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram-cards')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('RECIPE_CARD_CACHE_SIZE', 100000)),
+        },
+    },
+    'state': {
+        'BACKEND': 'api.cache_backends.DurableFileBasedCache',
+        'LOCATION': os.getenv(
+            'STATE_CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram-state')
+        ),
+    },
+    'tokens': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv(
+            'TOKEN_CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram-tokens')
+        ),
+        'TIMEOUT': int(os.getenv('TOKEN_CACHE_TIMEOUT', 5 * 60)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('TOKEN_CACHE_SIZE', 10000)),
+        },
+    },
+}
+
+# Сколько секунд карточка рецепта живет в кэше без обращений к ней.
+RECIPE_CARD_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_CARD_CACHE_TIMEOUT', 24 * 60 * 60)
+)
+
+# Файл индекса инградиентов, общий для всех воркеров на сервере.
+INGREDIENT_INDEX_PATH = os.getenv(
+    'INGREDIENT_INDEX_PATH',
+    os.path.join(tempfile.gettempdir(), 'foodgram-ingredients.idx')
+)
+
+# Запросы дольше стольких миллисекунд пишутся в лог с самыми долгими
+# SQL-запросами, см. api.metrics.
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 500))
+
+# Доля запросов, которые профилируются в фоне, и сколько последних
+# профилей хранится, см. api.profiling.
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 200))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.metrics': {'handlers': ['console'], 'level': 'WARNING'},
+    },
+}
@@ -1,6 +1,13 @@
+from api import images, shopping_list
 from django.contrib import admin
 from django.contrib.auth.models import Group
-from recipes.models import Favorite, Ingredient, Recipe, Tag, User
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredients,
+                            RequestProfile, Tag, User)
 
 
 @admin.register(User)
@@ -13,16 +20,38 @@ class UserAdmin(admin.ModelAdmin):
     search_fields = ('email', 'first_name')
 
 
+class RecipeIngredientsInline(admin.TabularInline):
+    """Инградиенты рецепта с количеством"""
+    model = RecipeIngredients
+    autocomplete_fields = ('ingredient',)
+    extra = 1
+
+
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     """Класс представления модели рецептов"""
     list_display = ('name', 'author')
     search_fields = ('name', 'tags__name', 'author__first_name')
     fields = (
-        'tags', 'author', 'ingredients', 'name',
+        'tags', 'author', 'name',
         'image', 'text', 'cooking_time', 'favorite',
     )
     readonly_fields = ('favorite',)
+    inlines = (RecipeIngredientsInline,)
+
+    def save_model(self, request, obj, form, change):
+        """Новое изображение уходит в очередь на уменьшенные копии."""
+        super().save_model(request, obj, form, change)
+        if 'image' in form.changed_data:
+            images.enqueue(obj)
+
+    def save_related(self, request, form, formsets, change):
+        """Изменение инградиентов пересчитывает списки покупок."""
+        old_amounts = (
+            shopping_list.recipe_amounts(form.instance) if change else {}
+        )
+        super().save_related(request, form, formsets, change)
+        shopping_list.change_recipe(form.instance, old_amounts)
 
     def favorite(self, obj):
         return Favorite.objects.filter(recipe=obj).count()
@@ -35,5 +64,59 @@ class IngredientAdmin(admin.ModelAdmin):
     search_fields = ('^name',)
 
 
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """Профили запросов: SQL и файл профиля для pstats или snakeviz"""
+    list_display = (
+        'created_at', 'method', 'path', 'status_code',
+        'duration', 'query_count', 'sampled', 'user',
+    )
+    list_filter = ('sampled', 'route')
+    search_fields = ('path',)
+    fields = (
+        'created_at', 'user', 'method', 'path', 'route', 'status_code',
+        'duration', 'query_count', 'sampled', 'download', 'queries',
+    )
+    readonly_fields = fields
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('profile')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:pk>/profile/',
+                self.admin_site.admin_view(self.download_profile),
+                name='recipes_requestprofile_download',
+            ),
+            *super().get_urls(),
+        ]
+
+    def download_profile(self, request, pk):
+        record = get_object_or_404(RequestProfile, pk=pk)
+        if not self.has_view_permission(request, record):
+            raise PermissionDenied
+        response = HttpResponse(
+            bytes(record.profile), content_type='application/octet-stream'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename=profile-{pk}.prof'
+        )
+        return response
+
+    def download(self, obj):
+        return format_html(
+            '<a href="{}">profile-{}.prof</a>',
+            reverse('admin:recipes_requestprofile_download', args=[obj.pk]),
+            obj.pk,
+        )
+
+
 admin.site.unregister(Group)
 admin.site.register(Tag)
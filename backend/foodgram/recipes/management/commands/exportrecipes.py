@@ -0,0 +1,183 @@
+import json
+import os
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredients,
+                            ShoppingCart, Subscription, Tag, User)
+
+# Разделы выгрузки в порядке записи: записи ссылаются только на
+# предыдущие разделы.
+SECTIONS = ['user', 'tag', 'ingredient', 'recipe', 'subscription']
+RELATIONS = ['tags', 'ingredients', 'favorited_by', 'in_cart_of']
+USER_FIELDS = [
+    'username', 'email', 'first_name', 'last_name', 'password', 'role',
+    'is_active', 'is_staff', 'is_superuser', 'date_joined',
+]
+
+
+def read_checkpoint(path):
+    try:
+        with open(path, encoding='utf-8') as checkpoint:
+            return json.load(checkpoint)
+    except FileNotFoundError:
+        return None
+
+
+def write_checkpoint(path, state):
+    """Файл отметки заменяется целиком: он не бывает записан наполовину."""
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as checkpoint:
+        json.dump(state, checkpoint)
+    os.replace(f'{path}.tmp', path)
+
+
+class Command(BaseCommand):
+    ''' Выгрузка рецептов со связанными данными в NDJSON '''
+    help = (
+        'Пишет пользователей, теги, инградиенты, рецепты с тегами, '
+        'инградиентами, избранным и корзинами и подписки по строке JSON на '
+        'запись. Записи ссылаются друг на друга по username, slug и '
+        'названию с единицей измерения, а не по id. Прерванная выгрузка '
+        'продолжается с отметки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл отметки, по умолчанию <path>.checkpoint.'
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        checkpoint = options['checkpoint'] or f'{options["path"]}.checkpoint'
+        state = read_checkpoint(checkpoint)
+        if state is None:
+            state = {'section': SECTIONS[0], 'last_id': 0, 'offset': 0}
+            output = open(options['path'], 'wb')
+        else:
+            # Строки после отметки могли не дописаться до конца.
+            output = open(options['path'], 'r+b')
+            output.truncate(state['offset'])
+            output.seek(state['offset'])
+            self.stdout.write(
+                f'Продолжение с раздела {state["section"]}, '
+                f'id больше {state["last_id"]}.'
+            )
+        with output:
+            for section in SECTIONS[SECTIONS.index(state['section']):]:
+                last_id = state['last_id'] if (
+                    section == state['section']
+                ) else 0
+                total = self.export(section, last_id, output, checkpoint)
+                self.stdout.write(f'{section}: {total}')
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            f'Выгрузка записана в {options["path"]}.'
+        ))
+
+    def export(self, section, last_id, output, checkpoint):
+        """Пишет записи раздела с id больше last_id пачками с отметками."""
+        rows = getattr(self, f'{section}_rows')().order_by('id')
+        records = getattr(self, f'{section}_records')
+        total = 0
+        while True:
+            batch = list(
+                rows.filter(id__gt=last_id)[:self.options['batch_size']]
+            )
+            if not batch:
+                return total
+            last_id = batch[-1]['id']
+            output.writelines(
+                json.dumps(record, ensure_ascii=False).encode() + b'\n'
+                for record in records(batch)
+            )
+            output.flush()
+            os.fsync(output.fileno())
+            total += len(batch)
+            write_checkpoint(checkpoint, {
+                'section': section,
+                'last_id': last_id,
+                'offset': output.tell(),
+            })
+
+    def user_rows(self):
+        return User.objects.values('id', *USER_FIELDS)
+
+    def user_records(self, batch):
+        for row in batch:
+            row.pop('id')
+            row['date_joined'] = row['date_joined'].isoformat()
+            yield {'type': 'user', **row}
+
+    def tag_rows(self):
+        return Tag.objects.values('id', 'name', 'slug', 'color')
+
+    def tag_records(self, batch):
+        for row in batch:
+            row.pop('id')
+            yield {'type': 'tag', **row}
+
+    def ingredient_rows(self):
+        return Ingredient.objects.values('id', 'name', 'measurement_unit')
+
+    def ingredient_records(self, batch):
+        for row in batch:
+            row.pop('id')
+            yield {'type': 'ingredient', **row}
+
+    def recipe_rows(self):
+        return Recipe.objects.values(
+            'id', 'author__username', 'name', 'text', 'cooking_time',
+            'image', 'processed_image', 'created_at',
+        )
+
+    def recipe_records(self, batch):
+        """Рецепты пачки со связями, по запросу на каждую связь."""
+        ids = [row['id'] for row in batch]
+        related = defaultdict(lambda: defaultdict(list))
+        for name, rows in (
+            ('tags', Recipe.tags.through.objects.values_list(
+                'recipe_id', 'tag__slug'
+            )),
+            ('ingredients', RecipeIngredients.objects.values_list(
+                'recipe_id', 'ingredient__name',
+                'ingredient__measurement_unit', 'amount',
+            )),
+            ('favorited_by', Favorite.objects.values_list(
+                'recipe_id', 'user__username'
+            )),
+            ('in_cart_of', ShoppingCart.objects.values_list(
+                'recipe_id', 'user__username'
+            )),
+        ):
+            for recipe_id, *value in rows.filter(
+                recipe_id__in=ids
+            ).order_by('id'):
+                related[name][recipe_id].append(
+                    value if len(value) > 1 else value[0]
+                )
+        for row in batch:
+            pk = row.pop('id')
+            yield {
+                'type': 'recipe',
+                'author': row.pop('author__username'),
+                **row,
+                'created_at': row['created_at'].isoformat(),
+                **{name: related[name][pk] for name in RELATIONS},
+            }
+
+    def subscription_rows(self):
+        return Subscription.objects.values(
+            'id', 'user__username', 'author__username'
+        )
+
+    def subscription_records(self, batch):
+        for row in batch:
+            yield {
+                'type': 'subscription',
+                'user': row['user__username'],
+                'author': row['author__username'],
+            }
@@ -0,0 +1,271 @@
+import json
+import os
+import random
+import time
+from functools import partial
+from itertools import accumulate, islice
+
+from api import catalog, ingredient_index
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredients,
+                            ShoppingCart, Subscription, Tag, User)
+
+COLORS = ['#E26C2D', '#49B64E', '#8775D2', '#F5C542', '#2D9CDB']
+# Слова названий и описаний: поиск по ним встречает и частые, и редкие
+# слова, как на живых данных.
+DISHES = [
+    'Суп', 'Салат', 'Пирог', 'Каша', 'Омлет', 'Рагу', 'Плов', 'Запеканка',
+    'Паста', 'Котлеты', 'Блины', 'Оладьи', 'Борщ', 'Жаркое', 'Гуляш',
+    'Пицца', 'Рулет', 'Сырники', 'Лазанья', 'Ризотто',
+]
+FILLINGS = [
+    'с курицей', 'с грибами', 'с сыром', 'с овощами', 'с яблоками',
+    'с творогом', 'с рыбой', 'с говядиной', 'с тыквой', 'с картофелем',
+    'с рисом', 'с ягодами', 'с зеленью', 'с чесноком', 'с медом',
+    'с креветками', 'с фасолью', 'с баклажанами', 'с орехами', 'с лососем',
+]
+WORDS = [
+    'добавьте', 'минут', 'перемешайте', 'нарежьте', 'обжарьте', 'масле',
+    'посолите', 'варите', 'луком', 'сковороде', 'огне', 'кастрюле',
+    'морковью', 'подавайте', 'запекайте', 'духовке', 'сметаной', 'соусом',
+    'специями', 'остудите', 'тесто', 'яйца', 'муку', 'сливки', 'томаты',
+    'перец', 'чеснок', 'имбирь', 'корицу', 'базилик', 'розмарин', 'тимьян',
+    'лимонный', 'сок', 'мелко', 'крупно', 'кубиками', 'соломкой', 'дольками',
+    'золотистой', 'корочки', 'мягкости', 'готовности', 'до', 'и', 'на',
+]
+
+
+class Zipf:
+    """Выбор элементов с убывающей частотой: первые встречаются чаще."""
+
+    def __init__(self, items, skew, rnd):
+        self.items = items
+        self.rnd = rnd
+        self.cum_weights = list(accumulate(
+            1 / (rank ** skew) for rank in range(1, len(items) + 1)
+        ))
+
+    def sample(self, k, exclude=None):
+        """k разных элементов, не считая exclude."""
+        k = min(k, len(self.items) - (exclude is not None))
+        result = set()
+        while len(result) < k:
+            item = self.rnd.choices(
+                self.items, cum_weights=self.cum_weights
+            )[0]
+            if item != exclude:
+                result.add(item)
+        return sorted(result)
+
+    def choices(self, k):
+        """k элементов с повторами."""
+        return self.rnd.choices(self.items, cum_weights=self.cum_weights, k=k)
+
+
+class Command(BaseCommand):
+    ''' Генерация тестовых данных для нагрузочных замеров '''
+    help = (
+        'Заполняет базу пользователями, рецептами, подписками, '
+        'избранным и списками покупок. Один seed дает одни и те же данные.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=5)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=12,
+            help='Наибольшее число инградиентов в рецепте.'
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Среднее число подписок пользователя.'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Среднее число рецептов в избранном пользователя.'
+        )
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Среднее число рецептов в списке покупок пользователя.'
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель распределения Ципфа для популярности.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='load')
+        parser.add_argument('--password', default='foodgram-load')
+
+    def handle(self, *args, **options):
+        if User.objects.filter(
+            username__startswith=f'{options["prefix"]}-'
+        ).exists():
+            raise CommandError(
+                f'Данные с префиксом {options["prefix"]} уже созданы.'
+            )
+        self.options = options
+        self.rnd = random.Random(options['seed'])
+        started = time.monotonic()
+        with transaction.atomic():
+            ingredients = self.load_ingredients()
+            users = self.create_users()
+            tags = self.create_tags()
+            recipes = self.create_recipes(users, tags, ingredients)
+            self.create_relations(users, recipes)
+            self.reset_sequences()
+            call_command('shoppinglists', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {time.monotonic() - started:.1f} с.'
+        ))
+
+    def next_id(self, model):
+        return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+    def insert(self, model, objects):
+        """Вставка пачками по batch_size без накопления в памяти."""
+        objects = iter(objects)
+        total = 0
+        while True:
+            batch = list(islice(objects, self.options['batch_size']))
+            if not batch:
+                break
+            model.objects.bulk_create(batch)
+            total += len(batch)
+        self.stdout.write(f'{model._meta.verbose_name_plural}: {total}')
+        return total
+
+    def load_ingredients(self):
+        """Каталог инградиентов; загружается из data/ingredients.json."""
+        if not Ingredient.objects.exists():
+            path = os.path.join(settings.BASE_DIR, 'data', 'ingredients.json')
+            with open(path, encoding='utf-8') as data_file_ingredients:
+                self.insert(Ingredient, (
+                    Ingredient(**ingredient)
+                    for ingredient in json.load(data_file_ingredients)
+                ))
+            ingredient_index.invalidate()
+        ingredients = list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        self.rnd.shuffle(ingredients)
+        return Zipf(ingredients, self.options['skew'], self.rnd)
+
+    def create_users(self):
+        first_id = self.next_id(User)
+        prefix = self.options['prefix']
+        password = make_password(self.options['password'])
+        ids = range(first_id, first_id + self.options['users'])
+        self.insert(User, (
+            User(
+                id=pk,
+                username=f'{prefix}-{pk}',
+                email=f'{prefix}-{pk}@example.com',
+                first_name=f'Имя {pk}',
+                last_name=f'Фамилия {pk}',
+                password=password,
+            )
+            for pk in ids
+        ))
+        return Zipf(list(ids), self.options['skew'], self.rnd)
+
+    def create_tags(self):
+        first_id = self.next_id(Tag)
+        prefix = self.options['prefix']
+        ids = range(first_id, first_id + self.options['tags'])
+        self.insert(Tag, (
+            Tag(
+                id=pk,
+                name=f'Тег {pk}',
+                slug=f'{prefix}-{pk}',
+                color=COLORS[pk % len(COLORS)],
+            )
+            for pk in ids
+        ))
+        # Вставка пачками идет без сигналов модели.
+        transaction.on_commit(partial(catalog.bump, catalog.TAGS))
+        return Zipf(list(ids), self.options['skew'], self.rnd)
+
+    def create_recipes(self, users, tags, ingredients):
+        """Рецепты с тегами и инградиентами, пачками по batch_size."""
+        first_id = self.next_id(Recipe)
+        ids = range(first_id, first_id + self.options['recipes'])
+        totals = dict.fromkeys(['recipes', 'tags', 'ingredients'], 0)
+        dishes = Zipf(DISHES, self.options['skew'], self.rnd)
+        fillings = Zipf(FILLINGS, self.options['skew'], self.rnd)
+        words = Zipf(WORDS, self.options['skew'], self.rnd)
+        for start in range(0, len(ids), self.options['batch_size']):
+            recipes, recipe_tags, amounts = [], [], []
+            for pk in ids[start:start + self.options['batch_size']]:
+                recipes.append(Recipe(
+                    id=pk,
+                    author_id=users.sample(1)[0],
+                    name='{} {}'.format(
+                        dishes.choices(1)[0], fillings.choices(1)[0]
+                    ),
+                    text=' '.join(words.choices(self.rnd.randint(10, 80))),
+                    cooking_time=self.rnd.randint(5, 180),
+                    image='recipes/load.png',
+                ))
+                recipe_tags += [
+                    Recipe.tags.through(recipe_id=pk, tag_id=tag)
+                    for tag in tags.sample(self.rnd.randint(1, 3))
+                ]
+                count = self.rnd.randint(
+                    1, self.options['ingredients_per_recipe']
+                )
+                for ingredient in ingredients.sample(count):
+                    amounts.append(RecipeIngredients(
+                        recipe_id=pk,
+                        ingredient_id=ingredient,
+                        amount=self.rnd.randint(1, 500),
+                    ))
+            Recipe.objects.bulk_create(recipes)
+            Recipe.tags.through.objects.bulk_create(recipe_tags)
+            RecipeIngredients.objects.bulk_create(amounts)
+            totals['recipes'] += len(recipes)
+            totals['tags'] += len(recipe_tags)
+            totals['ingredients'] += len(amounts)
+        self.stdout.write(
+            'Рецепты: {recipes}, теги рецептов: {tags}, '
+            'инградиенты рецептов: {ingredients}'.format(**totals)
+        )
+        return Zipf(list(ids), self.options['skew'], self.rnd)
+
+    def create_relations(self, users, recipes):
+        options = self.options
+        self.insert(Subscription, (
+            Subscription(user_id=user, author_id=author)
+            for user in users.items
+            for author in users.sample(
+                self.rnd.randint(0, 2 * options['subscriptions']),
+                exclude=user,
+            )
+        ))
+        for model, average in (
+            (Favorite, options['favorites']),
+            (ShoppingCart, options['cart']),
+        ):
+            self.insert(model, (
+                model(user_id=user, recipe_id=recipe)
+                for user in users.items
+                for recipe in recipes.sample(
+                    self.rnd.randint(0, 2 * average)
+                )
+            ))
+
+    def reset_sequences(self):
+        """Первичные ключи заданы явно: сдвигаем последовательности."""
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [User, Tag, Recipe]
+        )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -1,18 +1,185 @@
+import csv
 import json
+import os
+import time
+from collections import defaultdict
+from itertools import islice
 
-from django.core.management.base import BaseCommand
+from api import ingredient_index
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from recipes.models import Ingredient
 
+# Сколько символов файла JSON читается за раз.
+CHUNK_SIZE = 64 * 1024
+NAME_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+
 
 class Command(BaseCommand):
-    ''' Загрузка данных из JSON-файла '''
+    ''' Загрузка каталога инградиентов из CSV или JSON '''
+    help = (
+        'Добавляет инградиенты из файла CSV (название, единица измерения) '
+        'или JSON (массив или поток объектов с name и measurement_unit). '
+        'Повторная загрузка того же файла ничего не меняет.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(settings.BASE_DIR, 'data', 'ingredients.json')
+        )
+        parser.add_argument(
+            '--format', choices=['csv', 'json'],
+            help='Формат файла, если его не видно по расширению.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--by-name', action='store_true',
+            help='Искать инградиент только по названию и обновлять единицу '
+                 'измерения. Для каталогов, где названия не повторяются.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Посчитать изменения и откатить их.'
+        )
 
     def handle(self, *args, **options):
-        self.stdout.write(self.style.WARNING('Загружаем ингридиенты!'))
-        with open('data/ingredients.json', encoding='utf-8',
-                  ) as data_file_ingredients:
-            ingredient_data = json.loads(data_file_ingredients.read())
-            for ingredients in ingredient_data:
-                Ingredient.objects.get_or_create(**ingredients)
-
-        self.stdout.write(self.style.SUCCESS('Ингридиенты загружены!'))
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1][1:]
+        read = getattr(self, f'read_{file_format.lower()}', None)
+        if read is None:
+            raise CommandError(f'Неизвестный формат файла {path}.')
+        self.by_name = options['by_name']
+        self.counts = dict.fromkeys(
+            ['inserted', 'updated', 'unchanged', 'skipped'], 0
+        )
+        started = time.perf_counter()
+        try:
+            file = open(path, encoding='utf-8', newline='')
+        except OSError as error:
+            raise CommandError(error)
+        with file, transaction.atomic():
+            rows = self.clean(read(file))
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                self.upsert(batch)
+            if options['dry_run']:
+                transaction.set_rollback(True)
+            elif self.counts['inserted'] or self.counts['updated']:
+                # Пачки пишутся без сигналов модели: индекс пересобирается
+                # один раз после фиксации.
+                ingredient_index.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            '{}: добавлено {inserted}, обновлено {updated}, без изменений '
+            '{unchanged}, пропущено {skipped} за {:.1f} с.'.format(
+                'Без записи' if options['dry_run'] else 'Загружено',
+                time.perf_counter() - started,
+                **self.counts,
+            )
+        ))
+
+    def read_csv(self, file):
+        """Строки CSV; заголовок с колонкой name задает порядок колонок."""
+        reader = csv.reader(file)
+        name, unit = 0, 1
+        for number, row in enumerate(reader):
+            header = [column.strip().lower() for column in row]
+            if number == 0 and 'name' in header:
+                name = header.index('name')
+                unit = next(
+                    (
+                        header.index(column)
+                        for column in ('measurement_unit', 'unit')
+                        if column in header
+                    ),
+                    unit,
+                )
+                continue
+            if len(row) > max(name, unit):
+                yield row[name], row[unit]
+            else:
+                yield None
+
+    def read_json(self, file):
+        """Объекты массива JSON или потока объектов, по одному."""
+        decoder = json.JSONDecoder()
+        buffer = ''
+        position = 0
+        eof = False
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n[,]':
+                position += 1
+            if position == len(buffer):
+                if eof:
+                    return
+                buffer, position = file.read(CHUNK_SIZE), 0
+                eof = not buffer
+                continue
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as error:
+                if eof:
+                    raise CommandError(f'Ошибка JSON: {error}')
+                chunk = file.read(CHUNK_SIZE)
+                buffer, position = buffer[position:] + chunk, 0
+                eof = not chunk
+                continue
+            if isinstance(item, dict):
+                yield item.get('name'), item.get(
+                    'measurement_unit', item.get('unit')
+                )
+            else:
+                yield None
+
+    def clean(self, rows):
+        """Пары (название, единица) без пробелов по краям и пустых."""
+        for row in rows:
+            name, unit = (
+                (str(value or '').strip() for value in row) if row
+                else ('', '')
+            )
+            if (
+                not name or not unit
+                or len(name) > NAME_LENGTH or len(unit) > UNIT_LENGTH
+            ):
+                self.counts['skipped'] += 1
+                continue
+            yield name, unit
+
+    def upsert(self, batch):
+        """Добавляет новые инградиенты пачки и обновляет измененные."""
+        # Повтор строки в пачке считается один раз, побеждает последний.
+        if self.by_name:
+            rows = list({name: unit for name, unit in batch}.items())
+        else:
+            rows = list(dict.fromkeys(batch))
+        self.counts['unchanged'] += len(batch) - len(rows)
+        existing = defaultdict(list)
+        for pk, name, unit in Ingredient.objects.filter(
+            name__in={name for name, _ in rows}
+        ).order_by('id').values_list('id', 'name', 'measurement_unit'):
+            existing[name].append((pk, unit))
+        created = []
+        # Новая единица измерения - id инградиентов, которым она задана.
+        changed = defaultdict(list)
+        for name, unit in rows:
+            found = existing[name]
+            if any(found_unit == unit for _, found_unit in found):
+                self.counts['unchanged'] += 1
+            elif self.by_name and found:
+                changed[unit].append(found[0][0])
+            else:
+                created.append(
+                    Ingredient(name=name, measurement_unit=unit)
+                )
+        Ingredient.objects.bulk_create(created)
+        for unit, ids in changed.items():
+            Ingredient.objects.filter(id__in=ids).update(
+                measurement_unit=unit
+            )
+            self.counts['updated'] += len(ids)
+        self.counts['inserted'] += len(created)
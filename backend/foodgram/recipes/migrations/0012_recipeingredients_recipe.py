@@ -0,0 +1,98 @@
+# Generated by Django 2.2.28 on 2026-10-17 09:12
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def copy_recipes(apps, schema_editor):
+    """
+    Переносит рецепт из таблицы связей в строку с количеством.
+    Строка, связанная с несколькими рецептами, копируется для каждого;
+    повторы инградиента в рецепте складываются, строки без рецепта
+    удаляются.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeIngredients = apps.get_model('recipes', 'RecipeIngredients')
+    Link = Recipe.ingredients.through
+    last_id = 0
+    while True:
+        links = list(
+            Link.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'recipe_id', 'recipeingredients_id')
+            [:BATCH_SIZE]
+        )
+        if not links:
+            break
+        last_id = links[-1][0]
+        rows = RecipeIngredients.objects.in_bulk(
+            [row_id for _, _, row_id in links]
+        )
+        updated, created = [], []
+        for _, recipe_id, row_id in links:
+            row = rows[row_id]
+            if row.recipe_id is None:
+                row.recipe_id = recipe_id
+                updated.append(row)
+            else:
+                created.append(RecipeIngredients(
+                    recipe_id=recipe_id,
+                    ingredient_id=row.ingredient_id,
+                    amount=row.amount,
+                ))
+        RecipeIngredients.objects.bulk_update(updated, ['recipe'])
+        RecipeIngredients.objects.bulk_create(created)
+    duplicates = (
+        RecipeIngredients.objects.filter(recipe__isnull=False)
+        .values('recipe_id', 'ingredient_id')
+        .annotate(rows=Count('id'), first_id=Min('id'), total=Sum('amount'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates.iterator():
+        RecipeIngredients.objects.filter(
+            id=duplicate['first_id']
+        ).update(amount=duplicate['total'])
+        RecipeIngredients.objects.filter(
+            recipe_id=duplicate['recipe_id'],
+            ingredient_id=duplicate['ingredient_id'],
+        ).exclude(id=duplicate['first_id']).delete()
+    RecipeIngredients.objects.filter(recipe__isnull=True).delete()
+
+
+def copy_links(apps, schema_editor):
+    """Обратный перенос: связи рецептов со строками количества."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeIngredients = apps.get_model('recipes', 'RecipeIngredients')
+    Link = Recipe.ingredients.through
+    rows = RecipeIngredients.objects.values_list('id', 'recipe_id')
+    batch = []
+    for row_id, recipe_id in rows.iterator(chunk_size=BATCH_SIZE):
+        batch.append(Link(recipe_id=recipe_id, recipeingredients_id=row_id))
+        if len(batch) == BATCH_SIZE:
+            Link.objects.bulk_create(batch)
+            batch = []
+    Link.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipeingredients',
+            name='recipe',
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='+',
+                to='recipes.Recipe',
+            ),
+        ),
+        migrations.RunPython(copy_recipes, copy_links),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 2.2.28 on 2026-10-17 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipeingredients_recipe'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='recipe',
+            name='ingredients',
+        ),
+        migrations.AlterField(
+            model_name='recipeingredients',
+            name='recipe',
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='recipe_ingredients',
+                to='recipes.Recipe',
+                verbose_name='Рецепт',
+            ),
+        ),
+        migrations.AlterField(
+            model_name='recipeingredients',
+            name='ingredient',
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name='recipe_ingredients',
+                to='recipes.Ingredient',
+                verbose_name='Инградиент',
+            ),
+        ),
+        migrations.AlterField(
+            model_name='recipeingredients',
+            name='amount',
+            field=models.PositiveSmallIntegerField(verbose_name='Количество'),
+        ),
+        migrations.AlterModelOptions(
+            name='recipeingredients',
+            options={'verbose_name_plural': 'Инградиенты рецептов'},
+        ),
+        migrations.AddConstraint(
+            model_name='recipeingredients',
+            constraint=models.UniqueConstraint(
+                fields=('recipe', 'ingredient'),
+                name='unique_recipe_ingredient',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='recipeingredients',
+            index=models.Index(
+                fields=['ingredient', 'recipe'],
+                name='recipe_ingredient_idx',
+            ),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients',
+            field=models.ManyToManyField(
+                related_name='recipes',
+                through='recipes.RecipeIngredients',
+                to='recipes.Ingredient',
+                verbose_name='Инградиенты',
+            ),
+        ),
+    ]
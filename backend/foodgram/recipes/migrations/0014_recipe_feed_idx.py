@@ -0,0 +1,27 @@
+# Generated by Django 2.2.28 on 2026-10-17 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_ingredients_through'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='recipe',
+            options={
+                'ordering': ('-created_at', '-id'),
+                'verbose_name_plural': 'Рецепты',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(
+                fields=['-created_at', '-id'],
+                name='recipe_feed_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.2.28 on 2026-10-17 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_recipe_feed_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(
+                fields=['author', '-created_at', '-id'],
+                name='recipe_author_feed_idx',
+            ),
+        ),
+    ]
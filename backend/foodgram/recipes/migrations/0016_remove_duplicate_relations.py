@@ -0,0 +1,76 @@
+# Generated by Django 2.2.28 on 2026-10-17 11:20
+
+from django.db import migrations
+from django.db.models import Count, F, Min, Sum
+
+BATCH_SIZE = 1000
+
+
+def remove_duplicates(model, fields):
+    """Оставляет первую строку из повторяющихся; id пользователей с ними."""
+    duplicates = (
+        model.objects.values(*fields)
+        .annotate(rows=Count('id'), first_id=Min('id'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    users = set()
+    for duplicate in duplicates.iterator():
+        model.objects.filter(
+            **{field: duplicate[field] for field in fields}
+        ).exclude(id=duplicate['first_id']).delete()
+        users.add(duplicate['user'])
+    return users
+
+
+def fill_shopping_lists(apps, user_ids):
+    """Пересчет сумм списков покупок пользователей user_ids."""
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    user_ids = sorted(user_ids)
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        batch = user_ids[start:start + BATCH_SIZE]
+        ShoppingListItem.objects.filter(user_id__in=batch).delete()
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(**total)
+            for total in ShoppingCart.objects
+            .filter(
+                user_id__in=batch,
+                recipe__recipe_ingredients__isnull=False,
+            )
+            .values(
+                'user_id',
+                ingredient_id=F('recipe__recipe_ingredients__ingredient_id'),
+            )
+            .annotate(amount=Sum('recipe__recipe_ingredients__amount'))
+            .order_by()
+        )
+
+
+def remove_duplicate_relations(apps, schema_editor):
+    """
+    Удаляет повторные подписки, избранное и рецепты в корзине перед
+    созданием уникальных индексов. Повторы в корзине учитывались в
+    суммах списков покупок, поэтому суммы таких пользователей
+    пересчитываются.
+    """
+    remove_duplicates(
+        apps.get_model('recipes', 'Subscription'), ['user', 'author']
+    )
+    remove_duplicates(apps.get_model('recipes', 'Favorite'), ['user', 'recipe'])
+    fill_shopping_lists(apps, remove_duplicates(
+        apps.get_model('recipes', 'ShoppingCart'), ['user', 'recipe']
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_author_feed_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_relations, migrations.RunPython.noop
+        ),
+    ]
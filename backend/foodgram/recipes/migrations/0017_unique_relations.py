@@ -0,0 +1,31 @@
+# Generated by Django 2.2.28 on 2026-10-17 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_remove_duplicate_relations'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='subscription',
+            constraint=models.UniqueConstraint(
+                fields=('user', 'author'), name='unique_subscription'
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(
+                fields=('user', 'recipe'), name='unique_shopping_cart'
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(
+                fields=('user', 'recipe'), name='unique_favorite'
+            ),
+        ),
+    ]
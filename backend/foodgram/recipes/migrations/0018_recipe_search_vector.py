@@ -0,0 +1,63 @@
+# Generated by Django 2.2.28 on 2026-10-17 12:40
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Название весит больше описания. Конфигурация russian та же, что у
+# запросов в api.search.
+CREATE_SEARCH = """
+CREATE FUNCTION recipes_recipe_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('pg_catalog.russian', coalesce(NEW.name, '')), 'A')
+        || setweight(to_tsvector('pg_catalog.russian', coalesce(NEW.text, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipes_recipe_search_vector
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_vector();
+
+UPDATE recipes_recipe SET name = name;
+
+CREATE INDEX recipe_search_idx ON recipes_recipe USING gin (search_vector);
+"""
+
+DROP_SEARCH = """
+DROP INDEX IF EXISTS recipe_search_idx;
+DROP TRIGGER IF EXISTS recipes_recipe_search_vector ON recipes_recipe;
+DROP FUNCTION IF EXISTS recipes_recipe_search_vector();
+"""
+
+
+def create_search(apps, schema_editor):
+    """
+    Триггер, заполнение вектора и GIN-индекс есть только на PostgreSQL;
+    на других базах поиск идет по названию и описанию без индекса.
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SEARCH)
+
+
+def drop_search(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_unique_relations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(create_search, drop_search),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.28 on 2026-10-17 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0018_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='processed_image',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.CreateModel(
+            name='RecipeImageTask',
+            fields=[
+                ('id', models.AutoField(
+                    auto_created=True, primary_key=True, serialize=False,
+                    verbose_name='ID'
+                )),
+                ('image', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('recipe', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='image_tasks', to='recipes.Recipe',
+                    verbose_name='Рецепт'
+                )),
+            ],
+            options={
+                'verbose_name_plural': 'Очередь изображений',
+            },
+        ),
+    ]
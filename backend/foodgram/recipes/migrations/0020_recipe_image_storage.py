@@ -0,0 +1,19 @@
+# Generated by Django 2.2.28 on 2026-10-17 08:16
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0019_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(db_index=True, help_text='Картинка, закодированная в Base64', storage=recipes.storage.ContentAddressedStorage(), upload_to='recipes', verbose_name='Изображение блюда'),
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
+from recipes.storage import ContentAddressedStorage
+
 
 class User(AbstractUser):
     """Модель для пользователей."""
@@ -45,15 +48,17 @@ class Subscription(models.Model):
     )
 
     class Meta:
-        models.UniqueConstraint(
-            fields=['user', 'author'],
-            name='unique_subscription'
-        )
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='unique_subscription'
+            ),
+        ]
 
 
 class Ingredient(models.Model):
     """Модель для инградиентов."""
-    name = models.CharField('Название', max_length=100)
+    name = models.CharField('Название', max_length=100, db_index=True)
     measurement_unit = models.CharField(max_length=30, verbose_name='Ед. изм.')
 
     class Meta:
@@ -63,18 +68,6 @@ class Ingredient(models.Model):
         return self.name
 
 
-class RecipeIngredients(models.Model):
-    """Модель связи рецепта с инградиентами."""
-    ingredient = models.ForeignKey(
-        Ingredient,
-        on_delete=models.DO_NOTHING
-    )
-    amount = models.PositiveSmallIntegerField()
-
-    def __str__(self):
-        return self.ingredient.name
-
-
 class Tag(models.Model):
     """Модель для тегов."""
     name = models.CharField(max_length=100)
@@ -102,8 +95,9 @@ class Recipe(models.Model):
         on_delete=models.CASCADE
     )
     ingredients = models.ManyToManyField(
-        RecipeIngredients,
-        related_name='recipe_ingredients',
+        Ingredient,
+        through='RecipeIngredients',
+        related_name='recipes',
         verbose_name='Инградиенты'
     )
     name = models.CharField(
@@ -112,6 +106,8 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipes',
+        storage=ContentAddressedStorage(),
+        db_index=True,
         verbose_name='Изображение блюда',
         help_text='Картинка, закодированная в Base64'
     )
@@ -124,15 +120,88 @@ class Recipe(models.Model):
         help_text='Заполните время приготовления'
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    # Поисковый вектор названия и описания. На PostgreSQL его заполняет
+    # триггер и по нему строится GIN-индекс, см. миграцию 0018.
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Изображение, для которого готовы уменьшенные копии; пока оно не
+    # совпадает с image, отдается оригинал. См. api.images.
+    processed_image = models.CharField(
+        max_length=100, blank=True, editable=False
+    )
 
     class Meta:
-        ordering = ('-created_at',)
+        ordering = ('-created_at', '-id')
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-created_at', '-id'],
+                name='recipe_feed_idx'
+            ),
+            models.Index(
+                fields=['author', '-created_at', '-id'],
+                name='recipe_author_feed_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeIngredients(models.Model):
+    """
+    Количество инградиента в рецепте.
+    Отдельные индексы по внешним ключам не нужны: их заменяют составные.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='recipe_ingredients',
+        db_index=False,
+        verbose_name='Рецепт'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.DO_NOTHING,
+        related_name='recipe_ingredients',
+        db_index=False,
+        verbose_name='Инградиент'
+    )
+    amount = models.PositiveSmallIntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name_plural = 'Инградиенты рецептов'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'ingredient'],
+                name='unique_recipe_ingredient'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['ingredient', 'recipe'],
+                name='recipe_ingredient_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return self.ingredient.name
+
+
+class RecipeImageTask(models.Model):
+    """Изображение рецепта в очереди на уменьшенные копии."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='image_tasks',
+        verbose_name='Рецепт'
+    )
+    image = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'Очередь изображений'
+
+
 class ShoppingCart(models.Model):
     """Модель списков покупок."""
     user = models.ForeignKey(
@@ -148,10 +217,40 @@ class ShoppingCart(models.Model):
     )
 
     class Meta:
-        models.UniqueConstraint(
-            fields=['user', 'recipe'],
-            name='unique_shopping_cart'
-        )
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_shopping_cart'
+            ),
+        ]
+
+
+class ShoppingListItem(models.Model):
+    """
+    Сумма инградиента по всем рецептам в корзине пользователя.
+    Обновляется вместе с корзиной и рецептами в ней.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Инградиент'
+    )
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            ),
+        ]
 
 
 class Favorite(models.Model):
@@ -170,7 +269,42 @@ class Favorite(models.Model):
     )
 
     class Meta:
-        models.UniqueConstraint(
-            fields=['user', 'recipe'],
-            name='unique_favorite'
-        )
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_favorite'
+            ),
+        ]
+
+
+class RequestProfile(models.Model):
+    """Профиль одного запроса к API с его SQL-запросами."""
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Время'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Пользователь'
+    )
+    method = models.CharField(max_length=10, verbose_name='Метод')
+    path = models.CharField(max_length=2000, verbose_name='Путь')
+    route = models.CharField(max_length=200, verbose_name='Маршрут')
+    status_code = models.PositiveSmallIntegerField(verbose_name='Статус')
+    duration = models.FloatField(verbose_name='Время ответа, мс')
+    query_count = models.PositiveIntegerField(verbose_name='SQL-запросов')
+    sampled = models.BooleanField(default=False, verbose_name='Выборка')
+    profile = models.BinaryField(verbose_name='Профиль')
+    queries = models.TextField(blank=True, verbose_name='SQL-запросы')
+
+    class Meta:
+        ordering = ('-created_at',)
+        verbose_name_plural = 'Профили запросов'
+
+    def __str__(self):
+        return f'{self.method} {self.path}'
@@ -0,0 +1,62 @@
+"""
+Хранилище изображений рецептов с именами по содержимому.
+
+Файл сохраняется как <каталог>/<ab>/<sha256><расширение>, где ab - первые
+символы хэша. Одинаковая картинка хранится один раз, сколько бы рецептов
+на нее ни ссылалось, а файл по имени никогда не меняется, поэтому nginx
+и CDN кэшируют его без срока. Файлы, на которые больше нет ссылок,
+удаляет команда cleanmedia.
+
+Ссылки не считаются при записи: cleanmedia сверяет файлы с базой и не
+трогает файлы моложе --grace секунд, а save обновляет дату изменения
+существующего файла. Проверка файла и его удаление в cleanmedia и
+проверка с обновлением даты в save идут под общей блокировкой, поэтому
+файл, отданный новому рецепту, не удаляется между ними.
+"""
+import hashlib
+import os
+from contextlib import contextmanager
+
+from django.core.files.storage import FileSystemStorage
+
+try:
+    import fcntl
+except ImportError:  # Windows: save и cleanmedia не синхронизируются
+    fcntl = None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def save(self, name, content, max_length=None):
+        name = self.hashed_name(name, content)
+        with self.lock():
+            if self.exists(name):
+                # Свежая дата изменения защищает файл от cleanmedia,
+                # пока ссылка на него еще не записана.
+                os.utime(self.path(name))
+                return name
+        # Новый файл пишется без блокировки: пока он пишется, его дата
+        # свежая. Одновременная запись той же картинки получит имя с
+        # суффиксом, лишний файл удалит cleanmedia.
+        return super().save(name, content, max_length)
+
+    @contextmanager
+    def lock(self):
+        """Блокировка между save и удалением файлов в cleanmedia."""
+        os.makedirs(self.location, exist_ok=True)
+        # Файл лежит вне каталогов изображений, cleanmedia его не видит.
+        with open(os.path.join(self.location, '.storage.lock'), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, digest[:2], digest + extension)